@@ -1,19 +1,20 @@
 # === pages/1_chat.py (Supabase + Auth Integrated, Fixed) ===
 import os, sys, json
 import streamlit as st
-import faiss
-import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 from openai import OpenAI
 from datetime import datetime
-from utils.faiss_utils import load_faiss_index_safe
-index = load_faiss_index_safe()
 
 # === Local Imports ===
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from memory.journal import log_entry, get_reinforcement_boost, adjust_reinforcement_score
-from scripts.strain_scraper import scrape_all_sources
+from utils.retrieval import hybrid_search_strains, get_term_indicators
+from utils.reranker import rerank
+from utils.query_filters import parse_filters
+from utils.embeddings import get_embedding as embed_text
+from utils.terpene_inference import infer_missing_terpenes
+from memory.journal import log_entry, adjust_reinforcement_score
+from scripts.strain_scraper import iter_scrape_batch
 from supabase_profile_utils import fetch_or_create_user_profile, update_user_profile_supabase
 
 try:
@@ -43,8 +44,6 @@ user_email = st.session_state["user"].user.email
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-index = faiss.read_index(os.path.join(ROOT, "vector_store/index.faiss"))
-metadata = pd.read_pickle(os.path.join(ROOT, "vector_store/docs_metadata.pkl"))
 
 with open(os.path.join(ROOT, "data/terpene_info.json"), encoding="utf-8") as f:
     terpene_info = json.load(f)
@@ -82,30 +81,28 @@ st.session_state.setdefault("last_answer", "")
 
 # === Embedding and Search ===
 @st.cache_data(show_spinner=False)
-def get_embedding(text, model="text-embedding-3-small"):
+def get_embedding(text, backend=None):
     try:
-        rsp = client.embeddings.create(input=[text], model=model)
-        return np.array(rsp.data[0].embedding).astype("float32")
+        # Backed by the on-disk cache shared with the survey page and other workers
+        return embed_text(text, backend)
     except Exception as e:
         st.error(f"Embedding error: {e}")
         return None
 
-def search_index(emb, k=5):
-    D, I = index.search(np.array([emb]), k)
-    results = pd.DataFrame([metadata[i] for i in I[0]])
-    results["score"] = D[0]
-
-    effs = set(memory["user_profile"].get("desired_effects", []))
-    aromas = set(memory["user_profile"].get("preferred_aromas", []))
-
-    def boost(row):
-        desc = row.get("content", "").lower()
-        base = sum(e.lower() in desc for e in effs) * 0.5 + sum(a.lower() in desc for a in aromas) * 0.3
-        reinforce = get_reinforcement_boost(row.get("strain_name"), memory["user_profile"])
-        return base + reinforce
-
-    results["adjusted_score"] = results.apply(boost, axis=1)
-    return results.sort_values("adjusted_score", ascending=False)
+RERANK_POOL = 200  # distinct strains re-ranked against the profile per question
+
+def search_index(question, k=5, agg="max", pool=RERANK_POOL, filters=None):
+    # BM25 + vector hits fused and collapsed so each card is a distinct strain;
+    # the embedding is only requested when the lexical match isn't decisive.
+    # A pool of candidates is then re-ranked against the profile in one pass.
+    results = hybrid_search_strains(question, lambda: get_embedding(question), max(pool, k),
+                                    agg=agg, filters=filters)
+    ranked = rerank(results, memory["user_profile"], get_term_indicators())
+    if results.attrs.get("embedding_skipped") and len(results):
+        # The question names a strain outright: it stays first, the rest follow the profile
+        named = ranked["doc_id"].to_numpy() == results["doc_id"].iloc[0]
+        ranked = pd.concat([ranked[named], ranked[~named]])
+    return ranked.head(k)
 
 # === Prompt Builder ===
 def build_prompt(history, question, context, profile, warn=None):
@@ -159,9 +156,8 @@ if user_input and not should_answer(user_input):
 # === Generate Response ===
 if user_input:
     with st.spinner("🔎 Thinking..."):
-        emb = get_embedding(user_input)
-        if emb is not None:
-            results = search_index(emb)
+        results = search_index(user_input, filters=parse_filters(user_input))
+        if not results.empty:
             context = "\n".join(results["content"].tolist())
             tried = memory["user_profile"].get("past_strains", [])
             new_strains = [r["strain_name"] for _, r in results.iterrows() if r["strain_name"] not in tried]
@@ -181,17 +177,26 @@ if st.session_state["last_question"] and st.session_state["last_answer"]:
     st.divider()
 
     st.subheader("🌿 Recommended Strains")
-    emb = get_embedding(st.session_state["last_question"])
-    results = search_index(emb)
-
+    results = search_index(st.session_state["last_question"],
+                           filters=parse_filters(st.session_state["last_question"]))
+    # One batched prediction for every card whose catalogue terpene is unknown
+    predicted = infer_missing_terpenes(results)
+
+    def render_details(card, scraped):
+        top_terps = scraped.get("terpenes", []) or [card["terpene"]]
+        card["header"].markdown(f"**{card['name']}** — Dominant Terpene: {top_terps[0]}")
+        cols = card["details"].container().columns(4)
+        cols[0].markdown("**Top Terpenes:**\n" + "\n".join(top_terps))
+        cols[1].markdown("**Feelings:**\n" + "\n".join(scraped.get("feelings", [])))
+        cols[2].markdown("**Helps With:**\n" + "\n".join(scraped.get("helps_with", [])))
+        cols[3].markdown("**Negatives:**\n" + "\n".join(scraped.get("negatives", [])))
+
+    cards = {}
     for i, row in results.iterrows():
         name = row["strain_name"]
-        scraped = scrape_all_sources(
-            row.get("leafly_url"),
-            row.get("allbud_url"),
-            row.get("weedmaps_url")
-        )
-        top_terps = scraped.get("terpenes", []) or [row.get("dominant_terpene", "Unknown")]
+        terpene = row.get("dominant_terpene", "Unknown")
+        if i in predicted.index:
+            terpene = f"{predicted.at[i, 'dominant_terpene']} (predicted, {predicted.at[i, 'probability']:.0%})"
 
         urls = {
             "leafly_url": row.get("leafly_url"),
@@ -207,16 +212,12 @@ if st.session_state["last_question"] and st.session_state["last_answer"]:
             f"[Weedmaps]({urls['weedmaps_url']})" if urls.get("weedmaps_url") else ""
         ]))
 
+        # Card skeleton first; scraped details are filled in below as they arrive
         with st.container():
-            st.markdown(f"**{name}** — Dominant Terpene: {top_terps[0]}")
+            header = st.empty()
             if source_links:
                 st.markdown(f"🔗 Sources: {source_links}")
-
-            cols = st.columns(4)
-            cols[0].markdown("**Top Terpenes:**\n" + "\n".join(top_terps))
-            cols[1].markdown("**Feelings:**\n" + "\n".join(scraped.get("feelings", [])))
-            cols[2].markdown("**Helps With:**\n" + "\n".join(scraped.get("helps_with", [])))
-            cols[3].markdown("**Negatives:**\n" + "\n".join(scraped.get("negatives", [])))
+            details = st.empty()
 
             with st.form(key=f"feedback_form_{name}_{i}", clear_on_submit=False):
                 feedback = st.radio(
@@ -227,17 +228,32 @@ if st.session_state["last_question"] and st.session_state["last_answer"]:
                     key=f"radio_{name}_{i}"
                 )
                 submitted = st.form_submit_button("📘 Log This")
-                if submitted and feedback != "None":
-                    log_entry({
-                        "timestamp": datetime.utcnow().isoformat(),
-                        "strain": name,
-                        "question": st.session_state["last_question"],
-                        "answer": st.session_state["last_answer"],
-                        "feedback": "positive" if feedback == "👍" else "negative",
-                        "effects_felt": scraped.get("feelings", [])
-                    }, email=user_email)
-                    adjust_reinforcement_score(memory["user_profile"], name, "positive" if feedback == "👍" else "negative")
-                    st.success(f"✅ Logged feedback and updated score for {name}.")
+            status = st.empty()
+
+        cards[i] = {"name": name, "terpene": terpene, "header": header, "details": details,
+                    "status": status, "feedback": feedback, "submitted": submitted}
+        render_details(cards[i], {})
+
+    # All sources of all cards are scraped at once; each card updates as its requests finish
+    scraped = {i: {} for i in cards}
+    for i, _, merged in iter_scrape_batch({i: row for i, row in results.iterrows()}):
+        scraped[i] = merged
+        render_details(cards[i], merged)
+
+    # Feedback is logged once the card's scraped effects are known
+    for i, card in cards.items():
+        if card["submitted"] and card["feedback"] != "None":
+            name = card["name"]
+            log_entry({
+                "timestamp": datetime.utcnow().isoformat(),
+                "strain": name,
+                "question": st.session_state["last_question"],
+                "answer": st.session_state["last_answer"],
+                "feedback": "positive" if card["feedback"] == "👍" else "negative",
+                "effects_felt": scraped[i].get("feelings", [])
+            }, email=user_email)
+            adjust_reinforcement_score(memory["user_profile"], name, "positive" if card["feedback"] == "👍" else "negative")
+            card["status"].success(f"✅ Logged feedback and updated score for {name}.")
 
     if (st.session_state["last_question"], st.session_state["last_answer"]) not in memory["history"]:
         memory["history"].append((st.session_state["last_question"], st.session_state["last_answer"]))
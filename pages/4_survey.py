@@ -2,47 +2,33 @@
 
 import streamlit as st
 import os
-import numpy as np
-import pandas as pd
-import faiss
 from dotenv import load_dotenv
-from openai import OpenAI
 from supabase_profile_utils import fetch_or_create_user_profile, update_user_profile_supabase
+from utils.faiss_utils import INDEX_PATH
+from utils.retrieval import search_strains_two_stage
+from utils.embeddings import get_embedding as embed_text
 
-# === Load Environment and OpenAI ===
+# === Load Environment ===
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# === Paths ===
-ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-FAISS_INDEX_PATH = os.path.join(ROOT_DIR, "vector_store", "index.faiss")
-DOCS_METADATA_PATH = os.path.join(ROOT_DIR, "vector_store", "docs_metadata.pkl")
-
-# === Load FAISS Index and Metadata ===
-if not os.path.exists(FAISS_INDEX_PATH):
-    st.error(f"❌ FAISS index not found: {FAISS_INDEX_PATH}")
+# === Check FAISS Index (loaded once per process by utils.retrieval) ===
+if not os.path.exists(INDEX_PATH):
+    st.error(f"❌ FAISS index not found: {INDEX_PATH}")
     st.stop()
 
-metadata = pd.read_pickle(DOCS_METADATA_PATH)
-if isinstance(metadata, list):
-    metadata = pd.DataFrame(metadata)
-
-index = faiss.read_index(FAISS_INDEX_PATH)
-
 # === Embedding & Search ===
-def get_embedding(text, model="text-embedding-3-small"):
+def get_embedding(text, backend=None):
     try:
-        response = client.embeddings.create(input=[text], model=model)
-        return np.array(response.data[0].embedding).astype("float32")
+        # Repeated profile summaries are served from the shared on-disk cache
+        return embed_text(text, backend)
     except Exception as e:
         st.error(f"❌ Embedding error: {e}")
         return None
 
-def search_index(query_embedding, top_k=5):
-    D, I = index.search(np.array([query_embedding]), top_k)
-    results = metadata.iloc[I[0]].copy()
-    results["score"] = D[0]
-    return results
+def search_index(query_embedding, top_k=5, agg="sum"):
+    # A profile describes a whole strain: shortlist strains by centroid, then
+    # rank them where several of their chunks agree
+    return search_strains_two_stage(query_embedding, top_k, agg=agg)
 
 # === Utility: Safe profile list getter ===
 def safe_get_list(profile, key):
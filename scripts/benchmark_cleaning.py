@@ -0,0 +1,92 @@
+# === scripts/benchmark_cleaning.py ===
+"""
+Benchmark name/description cleaning on the Leafly CSV.
+
+    python scripts/benchmark_cleaning.py                       # data/leafly_strain_data_project.csv
+    python scripts/benchmark_cleaning.py --repeat 20 --workers 1,4,8 --output clean.json
+
+Times the row-wise reference (``fix_strain_name`` / ``clean_description``
+through ``.apply``) against the column engine at each worker count, reports
+rows/second, and checks that every engine run matches the reference.
+``--repeat`` tiles the CSV to simulate a larger scrape.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.text_cleaning import clean_description, clean_descriptions, clean_names, fix_strain_name
+
+# === Paths ===
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+INPUT_CSV = os.path.join(ROOT_DIR, "data", "leafly_strain_data_project.csv")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark strain text cleaning throughput.")
+    parser.add_argument("--input", default=INPUT_CSV, help="raw Leafly CSV")
+    parser.add_argument("--repeat", type=int, default=1, help="tile the rows this many times")
+    parser.add_argument("--workers", default=f"1,{os.cpu_count() or 1}",
+                        help="comma-separated worker counts for the column engine")
+    parser.add_argument("--output", help="JSON report path")
+    return parser.parse_args()
+
+def timed(fn) -> tuple:
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+def rate(rows: int, seconds: float) -> dict:
+    return {"seconds": round(seconds, 3), "rows_per_sec": round(rows / max(seconds, 1e-9), 1)}
+
+# === Main ===
+def main():
+    args = parse_args()
+    print(f"🔍 Loading → {args.input}")
+    df = pd.read_csv(args.input, usecols=lambda c: c in ("name", "strain_name", "description"))
+    names = df["strain_name"] if "strain_name" in df.columns else df["name"]
+    descriptions = df["description"]
+    if args.repeat > 1:
+        names = pd.concat([names] * args.repeat, ignore_index=True)
+        descriptions = pd.concat([descriptions] * args.repeat, ignore_index=True)
+    rows = len(descriptions)
+    print(f"🧪 {rows:,} rows ({descriptions.astype(str).str.contains('[<&]').mean():.1%} with markup)")
+
+    (ref_names, ref_desc), seconds = timed(
+        lambda: (names.apply(fix_strain_name), descriptions.apply(clean_description)))
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "pandas": pd.__version__,
+                 "cpus": os.cpu_count(), "platform": platform.platform()},
+        "rows": rows,
+        "row_wise": rate(rows, seconds),
+        "engine": [],
+    }
+    print(f"  row-wise apply:       {report['row_wise']['rows_per_sec']:>12,.1f} rows/s")
+
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        (eng_names, eng_desc), seconds = timed(
+            lambda: (clean_names(names, workers), clean_descriptions(descriptions, workers)))
+        matches = bool((eng_names.to_numpy() == ref_names.to_numpy()).all()
+                       and (eng_desc.to_numpy() == ref_desc.to_numpy()).all())
+        row = {"workers": workers, **rate(rows, seconds), "matches_row_wise": matches,
+               "speedup": round(report["row_wise"]["seconds"] / max(seconds, 1e-9), 2)}
+        report["engine"].append(row)
+        print(f"  engine workers={workers:<3} {row['rows_per_sec']:>12,.1f} rows/s  "
+              f"×{row['speedup']:<6} {'✅' if matches else '❌ output differs'}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Saved → {args.output}")
+    if not all(row["matches_row_wise"] for row in report["engine"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
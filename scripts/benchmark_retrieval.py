@@ -0,0 +1,245 @@
+# === scripts/benchmark_retrieval.py ===
+"""
+Benchmark the retrieval path used by the chat and survey pages against the
+real vector_store artifacts.
+
+    python scripts/benchmark_retrieval.py                      # synthetic queries
+    python scripts/benchmark_retrieval.py --queries q.npy      # recorded query vectors
+    python scripts/benchmark_retrieval.py --batch-sizes 1,16,64 --threads 1,4 --output bench.json
+
+Reports cold-load time, p50/p95/p99 single-query latency for each search
+path, batched FAISS throughput (QPS) over batch sizes × OpenMP threads,
+concurrent app-path throughput over Python threads, recall@k against exact
+search over the live rows, and resident memory. Results are written as
+JSON (default vector_store/benchmarks/<index_type>-<metric>-<timestamp>.json)
+so runs for different index configurations can be diffed.
+
+Synthetic queries are stored vectors plus Gaussian noise, so they are not
+trivially their own nearest neighbour.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.faiss_utils import normalize_rows, rerank_exact
+from utils import retrieval
+
+# === Paths ===
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BENCHMARK_DIR = os.path.join(ROOT_DIR, "vector_store", "benchmarks")
+
+# Search paths as the pages call them
+PATHS = {
+    "search": lambda q, k: retrieval.search(q, k),
+    "search_strains": lambda q, k: retrieval.search_strains(q, k),
+    "search_strains_two_stage": lambda q, k: retrieval.search_strains_two_stage(q, k, agg="sum"),
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency, throughput and recall.")
+    parser.add_argument("--queries", help=".npy file of recorded query vectors (default: synthetic)")
+    parser.add_argument("--n-queries", type=int, default=500, help="synthetic queries (or cap on recorded ones)")
+    parser.add_argument("--noise", type=float, default=1.0,
+                        help="synthetic query noise, relative to the vector's per-dimension RMS")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-sizes", default="1,8,32,128")
+    parser.add_argument("--threads", default="1,2,4,8")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"comma-separated subset of {tuple(PATHS)}")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="JSON report path")
+    return parser.parse_args()
+
+def int_list(text: str) -> list:
+    return [int(v) for v in text.split(",") if v.strip()]
+
+# === Memory ===
+def memory_mb() -> dict:
+    """Current and peak resident set size of this process."""
+    usage = {}
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key = "rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"
+                    usage[key] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if "peak_rss_mb" not in usage:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return usage
+
+# === Queries ===
+def load_queries(args, matrix) -> tuple:
+    rng = np.random.default_rng(args.seed)
+    if args.queries:
+        queries = np.load(args.queries).astype("float32")
+        if queries.ndim != 2 or queries.shape[1] != matrix.shape[1]:
+            raise ValueError(f"Query vectors must be (n, {matrix.shape[1]}), got {queries.shape}")
+        return queries[:args.n_queries], "recorded"
+    rows = np.sort(rng.choice(len(matrix), size=min(args.n_queries, len(matrix)), replace=False))
+    base = np.asarray(matrix[rows], dtype="float32")
+    rms = np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+    queries = base + rng.standard_normal(base.shape).astype("float32") * args.noise * rms
+    return np.ascontiguousarray(queries, dtype="float32"), "synthetic"
+
+def prepare_queries(queries: np.ndarray, metric: str) -> np.ndarray:
+    return normalize_rows(queries) if metric == "ip" else queries
+
+# === Measurements ===
+def cold_load() -> dict:
+    """Time each shared resource from a clean slate, as a fresh worker would."""
+    retrieval.clear_resources()
+    timings = {}
+    start = time.perf_counter()
+    for name, load in (("index_config", retrieval.get_index_config), ("index", retrieval.get_index),
+                       ("metadata", retrieval.get_metadata), ("matrix", retrieval.get_matrix),
+                       ("live_mask", retrieval.get_live_mask),
+                       ("strain_centroids", retrieval.get_strain_centroids)):
+        t0 = time.perf_counter()
+        load()
+        timings[f"{name}_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return timings
+
+def latency(fn, queries: np.ndarray, k: int) -> dict:
+    fn(queries[0], k)  # first-touch page faults are cold-load, not latency
+    timings = np.empty(len(queries))
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        fn(q, k)
+        timings[i] = time.perf_counter() - t0
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+    return {"n_queries": len(queries), "mean_ms": round(float(timings.mean() * 1000), 3),
+            "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+def search_batch(index, matrix, queries: np.ndarray, k: int, rerank_factor=None, metric="l2"):
+    """Batched FAISS search, with the per-query exact re-rank compressed indexes use."""
+    if not rerank_factor:
+        return index.search(queries, k)[1]
+    _, I = index.search(queries, k * rerank_factor)
+    return [rerank_exact(matrix, q.reshape(1, -1), ids, k, metric)[1] for q, ids in zip(queries, I)]
+
+def batched_throughput(queries: np.ndarray, k: int, batch_sizes: list, threads: list, metric: str) -> list:
+    index = retrieval.get_index()
+    matrix = retrieval.get_matrix()
+    rerank_factor = retrieval.get_index_config().get("params", {}).get("rerank_factor")
+    default_threads = faiss.omp_get_max_threads()
+    rows = []
+    try:
+        for t in threads:
+            faiss.omp_set_num_threads(t)
+            for b in batch_sizes:
+                search_batch(index, matrix, queries[:b], k, rerank_factor, metric)  # warm-up
+                t0 = time.perf_counter()
+                for lo in range(0, len(queries), b):
+                    search_batch(index, matrix, queries[lo:lo + b], k, rerank_factor, metric)
+                elapsed = time.perf_counter() - t0
+                rows.append({"batch_size": b, "omp_threads": t, "qps": round(len(queries) / elapsed, 1)})
+    finally:
+        faiss.omp_set_num_threads(default_threads)
+    return rows
+
+def concurrent_throughput(fn, queries: np.ndarray, k: int, threads: list) -> list:
+    """Queries/sec when ``t`` request threads share one process (one query per call)."""
+    default_threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)  # avoid oversubscribing cores with OpenMP inside each request
+    rows = []
+    try:
+        for t in threads:
+            with ThreadPoolExecutor(max_workers=t) as pool:
+                t0 = time.perf_counter()
+                list(pool.map(lambda q: fn(q, k), queries))
+                elapsed = time.perf_counter() - t0
+            rows.append({"threads": t, "qps": round(len(queries) / elapsed, 1)})
+    finally:
+        faiss.omp_set_num_threads(default_threads)
+    return rows
+
+def exact_neighbours(queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    """Ground truth over live rows only, so tombstoned ids never count as misses."""
+    matrix = retrieval.get_matrix()
+    live = retrieval.get_live_mask()
+    ids = np.arange(len(matrix), dtype=np.int64) if live is None else np.flatnonzero(live)
+    exact = faiss.IndexIDMap(faiss.IndexFlat(matrix.shape[1],
+                                             faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2))
+    for lo in range(0, len(ids), 65536):
+        block = ids[lo:lo + 65536]
+        exact.add_with_ids(np.ascontiguousarray(matrix[block], dtype="float32"), block)
+    return exact.search(queries, k)[1]
+
+def recall(queries: np.ndarray, k: int, metric: str) -> dict:
+    truth = exact_neighbours(prepare_queries(queries, metric), k, metric)
+    hits = 0
+    for q, t in zip(queries, truth):
+        _, found = retrieval.search_ids(q, k)
+        hits += len(np.intersect1d(t[t >= 0], found))
+    return {"k": k, f"recall@{k}": round(hits / max(int((truth >= 0).sum()), 1), 4)}
+
+# === Main ===
+def main():
+    args = parse_args()
+    paths = [p for p in args.paths.split(",") if p]
+    unknown = [p for p in paths if p not in PATHS]
+    if unknown:
+        raise ValueError(f"Unknown search paths: {unknown} (expected {tuple(PATHS)})")
+
+    memory_before = memory_mb()
+    print("⏱️ Cold load …")
+    load = cold_load()
+    memory_loaded = memory_mb()
+    config = retrieval.get_index_config()
+    metric = config.get("metric", "l2")
+
+    queries, source = load_queries(args, retrieval.get_matrix())
+    print(f"🔍 {len(queries)} {source} queries, k={args.k}, index={config.get('index_type')} ({metric})")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"python": platform.python_version(), "faiss": faiss.__version__,
+                 "cpus": os.cpu_count(), "platform": platform.platform()},
+        "index": {key: config.get(key) for key in ("index_type", "metric", "dim", "ntotal", "params",
+                                                   "embedding_model")},
+        "queries": {"source": source, "n": len(queries), "k": args.k},
+        "cold_load": load,
+        "latency": {},
+    }
+    for name in paths:
+        report["latency"][name] = latency(PATHS[name], queries, args.k)
+        stats = report["latency"][name]
+        print(f"  {name}: p50={stats['p50_ms']:.2f} ms  p95={stats['p95_ms']:.2f} ms  p99={stats['p99_ms']:.2f} ms")
+
+    print("🚀 Throughput …")
+    report["batched"] = batched_throughput(prepare_queries(queries, metric), args.k,
+                                           int_list(args.batch_sizes), int_list(args.threads), metric)
+    report["concurrent"] = {name: concurrent_throughput(PATHS[name], queries, args.k, int_list(args.threads))
+                            for name in paths}
+    for row in report["batched"]:
+        print(f"  batch={row['batch_size']:<4} omp_threads={row['omp_threads']:<2} {row['qps']:>10.1f} QPS")
+
+    print("🎯 Recall …")
+    report["recall"] = recall(queries, args.k, metric)
+    report["memory"] = {"before_load": memory_before, "after_load": memory_loaded, "after_run": memory_mb()}
+    print(f"  recall@{args.k}={report['recall'][f'recall@{args.k}']:.3f}  "
+          f"rss={report['memory']['after_run'].get('rss_mb')} MB")
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, f"{config.get('index_type', 'flat')}-{metric}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Saved → {output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,45 @@
 # === scripts/build_faiss.py (Hardened) ===
+"""
+Build the FAISS vector store from the embedding shards in data/embeddings/
+(or a legacy data/docs_df_with_embeddings.parquet).
+
+    python scripts/build_faiss.py --index-type flat
+    python scripts/build_faiss.py --index-type ivf --nlist 256 --nprobe 16
+    python scripts/build_faiss.py --index-type hnsw --hnsw-m 32 --ef-search 64
+    python scripts/build_faiss.py --index-type sq8 --rerank-factor 4
+    python scripts/build_faiss.py --index-type hnsw --metric ip   # cosine similarity
+    python scripts/build_faiss.py --incremental        # apply catalogue changes only
+    python scripts/build_faiss.py --compact            # merge update segments
+
+Approximate indexes are scored against exact search (recall@k, p50/p99
+latency) on held-out query vectors, which are only added to the index once
+the report is done (so no query can find itself), and the chosen configuration is written
+to vector_store/index_config.json so the app loads it with the same
+nprobe / efSearch. Compressed indexes (sq8, fp16, pq) only generate
+candidates; the top k·rerank_factor are re-ranked exactly against the
+memory-mapped embeddings_matrix.npy.
+
+--metric ip L2-normalises every vector once at build time (the stored
+matrix is normalised too) and uses inner-product indexes, so scores are
+cosine similarities. Queries are normalised the same way at search time.
+
+--incremental diffs the parquet against the live store by (strain name,
+chunk_index), so removing a strain from the catalogue leaves the others'
+keys alone: new chunks are appended as a segment, deleted strains are
+removed and chunks whose text changed are replaced. Segments are compacted
+back into one base automatically once they pile up.
+"""
 
 import os
-import pandas as pd
+import sys
+import argparse
 import numpy as np
-import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.faiss_utils import (
+    INDEX_TYPES, METRICS, build_index, build_metadata, compact_vector_store, evaluate_index,
+    embedding_model_of, load_embeddings, prepare_vectors, resolve_index_params, update_vector_store, write_vector_store,
+)
 
 # === Paths ===
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -11,63 +47,114 @@ DATA_PATH = os.path.join(ROOT_DIR, "data", "docs_df_with_embeddings.parquet")
 VECTOR_STORE_DIR = os.path.join(ROOT_DIR, "vector_store")
 INDEX_PATH = os.path.join(VECTOR_STORE_DIR, "index.faiss")
 MATRIX_PATH = os.path.join(VECTOR_STORE_DIR, "embeddings_matrix.npy")
-METADATA_PATH = os.path.join(VECTOR_STORE_DIR, "docs_metadata.pkl")
-
-# === URL Utility ===
-def generate_leafly_url(name: str) -> str:
-    if isinstance(name, str) and name.strip():
-        slug = name.strip().lower().replace(" ", "-").replace("'", "")
-        return f"https://www.leafly.com/strains/{slug}"
-    return "https://www.leafly.com/strains"
-
-# === Load and Validate Data ===
-print(f"📂 Loading: {DATA_PATH}")
-if not os.path.exists(DATA_PATH):
-    raise FileNotFoundError(f"❌ Missing file: {DATA_PATH}")
-
-df = pd.read_parquet(DATA_PATH)
-
-if "embedding" not in df.columns:
-    raise ValueError("❌ 'embedding' column missing. Cannot proceed.")
-
-df = df.dropna(subset=["embedding"])
-if df.empty:
-    raise ValueError("❌ No rows with valid embeddings.")
-
-# === Build FAISS Index ===
-print("⚙️ Building FAISS index …")
-embedding_dim = len(df["embedding"].iloc[0])
-embedding_matrix = np.vstack(df["embedding"].tolist()).astype("float32")
-
-index = faiss.IndexFlatL2(embedding_dim)
-index.add(embedding_matrix)
-
-# === Ensure Output Directory Exists ===
-os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-
-# === Save Artifacts ===
-faiss.write_index(index, INDEX_PATH)
-np.save(MATRIX_PATH, embedding_matrix)
-
-print(f"✅ FAISS index with {index.ntotal:,} vectors (dim={embedding_dim})")
-print(f"📦 Saved: {INDEX_PATH}")
-print(f"📦 Saved: {MATRIX_PATH}")
-
-# === Build Metadata ===
-print("🧠 Creating metadata …")
-required_cols = ["strain_id", "strain_name", "chunk", "effects", "dominant_terpene"]
-missing_cols = [c for c in required_cols if c not in df.columns]
-if missing_cols:
-    raise ValueError(f"❌ Missing metadata columns: {missing_cols}")
-
-metadata_df = df[required_cols].copy()
-metadata_df["leafly_url"] = metadata_df["strain_name"].apply(generate_leafly_url)
-metadata_df.rename(columns={"chunk": "content"}, inplace=True)
-metadata_df.dropna(subset=["content"], inplace=True)
-
-# Convert to list-of-dicts format for Streamlit/JSON usage
-metadata = metadata_df.to_dict(orient="records")
-pd.to_pickle(metadata, METADATA_PATH)
-
-print(f"📦 Saved: {METADATA_PATH}")
-print("✅ All vector and metadata artifacts built successfully.")
+METADATA_PATH = os.path.join(VECTOR_STORE_DIR, "docs_metadata.arrow")
+TERM_INDICATORS_PATH = os.path.join(VECTOR_STORE_DIR, "term_indicators.npy")
+
+# Index types that learn from data; they train on a capped sample, not a full copy
+TRAINED_TYPES = ("ivf", "sq8", "pq")
+TRAIN_SAMPLE_MAX = 100_000
+
+def add_except(index, matrix: np.ndarray, skip: np.ndarray):
+    """Add every row of ``matrix`` (id = row number) except ``skip``, as contiguous views."""
+    bounds = np.concatenate([[-1], np.sort(skip), [len(matrix)]]).astype(np.int64)
+    for lo, hi in zip(bounds[:-1] + 1, bounds[1:]):
+        if hi > lo:
+            index.add_with_ids(matrix[lo:hi], np.arange(lo, hi, dtype=np.int64))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS vector store.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--metric", choices=METRICS, default="l2",
+                        help="ip: normalise vectors at build time and search by cosine similarity")
+    parser.add_argument("--nlist", type=int, help="IVF: number of inverted lists (default ≈ 4·sqrt(N))")
+    parser.add_argument("--nprobe", type=int, help="IVF: lists visited per query")
+    parser.add_argument("--hnsw-m", dest="M", type=int, help="HNSW: neighbours per node")
+    parser.add_argument("--ef-construction", dest="efConstruction", type=int, help="HNSW: build-time beam width")
+    parser.add_argument("--ef-search", dest="efSearch", type=int, help="HNSW: query-time beam width")
+    parser.add_argument("--pq-m", dest="m", type=int, help="PQ: number of sub-quantizers (must divide dim)")
+    parser.add_argument("--pq-nbits", dest="nbits", type=int, help="PQ: bits per sub-quantizer code")
+    parser.add_argument("--rerank-factor", type=int, help="sq8/fp16/pq: candidates re-ranked per result")
+    parser.add_argument("--eval-queries", type=int, default=200, help="held-out query vectors for the report")
+    parser.add_argument("--eval-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--incremental", action="store_true",
+                        help="apply added/changed/removed chunks to the existing store")
+    parser.add_argument("--compact", action="store_true", help="merge update segments into one base")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.compact and not args.incremental:
+        compact_vector_store()
+        return
+
+    # === Load and Validate Data ===
+    print("📂 Loading embeddings …")
+    df, embedding_matrix = load_embeddings(DATA_PATH)
+
+    if args.incremental:
+        update_vector_store(df, embedding_matrix, compact=True if args.compact else None)
+        return
+
+    # === Build FAISS Index ===
+    print(f"⚙️ Building {args.index_type} FAISS index ({args.metric}) …")
+    embedding_dim = embedding_matrix.shape[1]
+    # The loaded matrix is ours: normalise in place rather than holding two copies
+    embedding_matrix = prepare_vectors(embedding_matrix, args.metric, copy=False)
+
+    # Hold out query vectors: kept out of training and out of the index until the report is done
+    rng = np.random.default_rng(args.seed)
+    n_eval = min(args.eval_queries, max(len(embedding_matrix) - args.eval_k, 0))
+    held_out = rng.choice(len(embedding_matrix), size=n_eval, replace=False)
+    train_sample = None
+    if args.index_type in TRAINED_TYPES:
+        train_rows = np.setdiff1d(np.arange(len(embedding_matrix)), held_out)
+        if len(train_rows) > TRAIN_SAMPLE_MAX:
+            train_rows = np.sort(rng.choice(train_rows, size=TRAIN_SAMPLE_MAX, replace=False))
+        if len(train_rows):
+            train_sample = embedding_matrix[train_rows]
+
+    params = resolve_index_params(
+        args.index_type, len(embedding_matrix),
+        nlist=args.nlist, nprobe=args.nprobe, M=args.M,
+        efConstruction=args.efConstruction, efSearch=args.efSearch,
+        m=args.m, nbits=args.nbits, rerank_factor=args.rerank_factor,
+    )
+    index = build_index(
+        embedding_matrix, args.index_type,
+        train_sample=train_sample,
+        metric=args.metric,
+        add=False,
+        **params,
+    )
+    add_except(index, embedding_matrix, held_out)
+
+    # === Recall / Latency Report ===
+    report = None
+    if n_eval:
+        report = evaluate_index(index, embedding_matrix, embedding_matrix[held_out], k=args.eval_k,
+                                rerank_factor=params.get("rerank_factor"), exclude=held_out)
+        recall_key = f"recall@{report['k']}"
+        print(f"📊 {recall_key}={report[recall_key]:.3f}  "
+              f"p50={report['p50_ms']:.2f} ms  p99={report['p99_ms']:.2f} ms  "
+              f"({report['n_queries']} queries)")
+        index.add_with_ids(embedding_matrix[held_out], held_out.astype(np.int64))
+
+    # === Save Artifacts ===
+    print("🧠 Creating metadata …")
+    metadata_df = build_metadata(df)
+
+    # Columnar + memory-mappable; row i is FAISS id i
+    indicators = write_vector_store(index, embedding_matrix, metadata_df, args.index_type, params, report,
+                                    embedding_model_of(df))
+
+    print(f"✅ FAISS index with {index.ntotal:,} vectors (dim={embedding_dim}, type={args.index_type}, metric={args.metric}, params={params})")
+    print(f"📦 Saved: {INDEX_PATH}")
+    print(f"📦 Saved: {MATRIX_PATH}")
+    print(f"📦 Saved: {METADATA_PATH}")
+    print(f"📦 Saved: {TERM_INDICATORS_PATH} {indicators.shape}")
+    print("✅ All vector and metadata artifacts built successfully.")
+
+if __name__ == "__main__":
+    main()
@@ -8,16 +8,38 @@ Clean raw Leafly CSV → parquet + XGBoost terpene-imputer
 4. Normalise THC/CBD columns
 5. Train / save XGBoost model to impute dominant terpene
 6. Export cleaned parquet  +   model / label-encoder pickles
+
+Names and descriptions are cleaned column-wise (utils/text_cleaning.py):
+only rows with markup are HTML-parsed, across ``--workers`` processes.
+Measure throughput with scripts/benchmark_cleaning.py.
+
+Re-runs are incremental: cleaned text is cached per row fingerprint
+(data/cache/cleaned_text.sqlite), so only new or changed rows are cleaned,
+and the imputer is only retrained when the hash of its training matrix,
+labels and hyper-parameters differs from the saved model's. ``--force``
+ignores both caches.
+
+The CSV is streamed with PyArrow in ``--block-mb`` blocks against a
+declared schema (every column parsed as text, then typed per batch:
+effect percentages, THC/CBD as floats, terpene fields as lower-cased
+text). Cleaned batches are staged to parquet while the imputer's training
+rows are collected; a second streamed pass imputes terpenes and writes the
+final parquet, so peak memory is one batch plus the training matrix.
 """
 
-import os, re, html, unicodedata, joblib
+import os, sys, csv, json, hashlib, argparse, joblib
 import pandas as pd
 import numpy  as np
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 import xgboost as xgb
-from bs4 import BeautifulSoup
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing  import LabelEncoder
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.text_cleaning import TextCache, clean_text_cached
+
 # ------------------------------------------------------------------#
 # Paths
 # ------------------------------------------------------------------#
@@ -25,156 +47,241 @@ ROOT_DIR   = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data
 INPUT_CSV  = os.path.join(ROOT_DIR, "leafly_strain_data_project.csv")
 OUTPUT_PAR = os.path.join(ROOT_DIR, "cleaned_strains.parquet")
 MODEL_DIR  = os.path.join(ROOT_DIR, "models")
+MODEL_PATH = os.path.join(MODEL_DIR, "xgb_terpene_predictor.pkl")
+ENCODER_PATH = os.path.join(MODEL_DIR, "terpene_label_encoder.pkl")
+MODEL_META_PATH = os.path.join(MODEL_DIR, "terpene_model_meta.json")
+STAGE_PAR  = OUTPUT_PAR + ".stage"
+
+# ------------------------------------------------------------------#
+# Input schema
+# ------------------------------------------------------------------#
+# Effect / condition columns: percentage strings ("66%") → float, missing = 0
+EFFECT_COLUMNS = [
+    "relaxed", "happy", "euphoric", "uplifted", "sleepy", "dry_mouth", "dry_eyes", "dizzy",
+    "paranoid", "anxious", "stress", "pain", "depression", "anxiety", "insomnia", "hungry",
+    "talkative", "headache", "ptsd", "creative", "energetic", "fatigue", "focused", "giggly",
+    "lack_of_appetite", "nausea", "headaches", "bipolar_disorder", "cancer", "tingly", "cramps",
+    "aroused", "gastrointestinal_disorder", "inflammation", "muscle_spasms", "eye_pressure",
+    "migraines", "asthma", "anorexia", "arthritis", "add/adhd", "muscular_dystrophy",
+    "hypertension", "glaucoma", "pms", "seizures", "spasticity", "spinal_cord_injury",
+    "fibromyalgia", "crohn's_disease", "phantom_limb_pain", "epilepsy", "multiple_sclerosis",
+    "parkinson's", "tourette's_syndrome", "alzheimer's", "hiv/aids", "tinnitus",
+]
+TERPENE_COLUMNS = ["most_common_terpene", "dominant_terpene"]   # first present is the label
+DROP_COLUMNS    = ["img_url", "strain_url"]
+# Columns the pipeline adds (or overwrites), in output order
+DERIVED_COLUMNS = ["strain_name", "aggressive_cleaned_description", "thc", "cbd", "dominant_terpene"]
+FLOAT_COLUMNS   = set(EFFECT_COLUMNS) | {"thc", "cbd"}
+# Same null markers as pandas.read_csv
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+             "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
 
-os.makedirs(MODEL_DIR, exist_ok=True)
+XGB_PARAMS = dict(
+    eval_metric="mlogloss",
+    max_depth=6,
+    n_estimators=300,
+    learning_rate=0.15,
+    subsample=0.8,
+    random_state=42,
+    tree_method="hist",
+)
 
 # ------------------------------------------------------------------#
 # Helpers
 # ------------------------------------------------------------------#
-BAD_REPLACEMENTS = {
-    "â€™": "'", "â€’": "-", "â€“": "-", "â€”": "-", "Ã©": "e",
-    "Ã": "A",  "�": "",  "“": '"', "”": '"'
-}
-
-INVISIBLE_SPACE_RE = re.compile(r"[\u00A0\u200B\u200C\u200D\u202F\u2060]+")
-
-def fix_strain_name(text: str) -> str:
-    if not isinstance(text, str):
-        return "unknown"
-    text = html.unescape(text)
-    text = BeautifulSoup(text, "html.parser").get_text()
-    text = unicodedata.normalize("NFKC", text)
-    for bad, good in BAD_REPLACEMENTS.items():
-        text = text.replace(bad, good)
-    return re.sub(r"\s+", " ", text).strip()
-
-def clean_description(text: str) -> str:
-    """Remove HTML, invisible bytes/spaces, keep punctuation & case."""
-    if not isinstance(text, str):
-        return ""
-    text = html.unescape(text)
-    text = BeautifulSoup(text, "html.parser").get_text(separator=" ")
-    text = unicodedata.normalize("NFKC", text)
-
-    # remove stray high-bit bytes while keeping ASCII punctuations
-    text = text.encode("ascii", "ignore").decode("ascii")
-    text = INVISIBLE_SPACE_RE.sub(" ", text)          # kill nbsp / zero-width
-    return re.sub(r"\s+", " ", text).strip()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clean the raw Leafly CSV and train the terpene imputer.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for HTML parsing / XGBoost threads (default: all cores)")
+    parser.add_argument("--force", action="store_true",
+                        help="re-clean every row and retrain even if nothing changed")
+    parser.add_argument("--block-mb", type=float, default=8,
+                        help="CSV bytes parsed per batch, in MB")
+    return parser.parse_args()
 
 def pct_to_float(series: pd.Series) -> pd.Series:
-    return (
-        series.astype(str)
-              .str.replace("%", "", regex=False)
-              .replace("", np.nan)
-              .astype(float)
-              .fillna(0.0)
+    return pd.to_numeric(series.astype(str).str.replace("%", "", regex=False),
+                         errors="coerce").fillna(0.0)
+
+def read_header(path: str) -> list:
+    with open(path, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f))
+
+def output_schema(columns: list) -> pa.Schema:
+    """Declared parquet schema: floats for effects/THC/CBD, text for everything else."""
+    return pa.schema([(c, pa.float64() if c in FLOAT_COLUMNS else pa.string()) for c in columns])
+
+def csv_batches(path: str, columns: list, block_mb: float):
+    """Raw CSV as pandas batches, every kept column parsed as text."""
+    reader = pv.open_csv(
+        path,
+        read_options=pv.ReadOptions(block_size=int(block_mb * 1024 * 1024)),
+        parse_options=pv.ParseOptions(newlines_in_values=True),   # multi-line descriptions
+        convert_options=pv.ConvertOptions(column_types={c: pa.string() for c in columns},
+                                          include_columns=columns, null_values=NA_VALUES,
+                                          strings_can_be_null=True),
     )
+    for batch in reader:
+        yield batch.to_pandas()
 
-# ------------------------------------------------------------------#
-# 1. Load raw CSV
-# ------------------------------------------------------------------#
-print(f"🔍 Loading → {INPUT_CSV}")
-df = pd.read_csv(INPUT_CSV)
+def type_batch(df: pd.DataFrame, offset: int, effect_cols: list, cache: TextCache, workers: int):
+    """Clean, filter and type one raw batch; ``offset`` is its first row number in the CSV."""
+    if "strain_name" not in df.columns:
+        df["strain_name"] = df["name"] if "name" in df.columns else \
+            pd.Series([f"strain_{i}" for i in range(offset, offset + len(df))], index=df.index)
 
-# ------------------------------------------------------------------#
-# 2. Basic column housekeeping
-# ------------------------------------------------------------------#
-df.drop(columns=["img_url", "strain_url"], errors="ignore", inplace=True)
+    df["strain_name"], df["aggressive_cleaned_description"], n_cleaned = clean_text_cached(
+        df["strain_name"], df["description"], cache, workers)
+    df = df[df["aggressive_cleaned_description"].str.len() > 40].copy()   # keep only useful rows
 
-if "strain_name" not in df.columns:
-    df["strain_name"] = df.get("name", pd.Series([f"strain_{i}" for i in range(len(df))]))
+    df["thc"] = pct_to_float(df["thc_level"].astype(str).str.extract(r"(\d+\.?\d*)")[0]) \
+        if "thc_level" in df.columns else 0.0
+    df["cbd"] = pd.to_numeric(df["cbd"], errors="coerce").fillna(0.0) if "cbd" in df.columns else 0.0
+    for c in effect_cols:
+        df[c] = pct_to_float(df[c])
 
-df["strain_name"] = df["strain_name"].apply(fix_strain_name)
+    terp_col = next((c for c in TERPENE_COLUMNS if c in df.columns), None)
+    if terp_col:
+        # A missing label is the literal "nan" (what str() has always made of it), so the
+        # imputer keeps learning it as a class like the shipped catalogue does
+        terpenes = df[terp_col].astype(object).fillna("nan").astype(str)
+        df["dominant_terpene"] = terpenes.str.lower().str.replace("\u03b2-", "beta-", regex=False)
+    else:
+        df["dominant_terpene"] = "unknown"
+    return df, n_cleaned
 
-# ------------------------------------------------------------------#
-# 3. Clean & filter descriptions
-# ------------------------------------------------------------------#
-df["aggressive_cleaned_description"] = df["description"].apply(clean_description)
-before = len(df)
-df = df[df["aggressive_cleaned_description"].str.len() > 40]   # keep only useful rows
-print(f"🧹 Dropped {before - len(df):,} rows with empty/short descriptions")
+def training_key(X: pd.DataFrame, y: pd.Series) -> str:
+    """Hash of everything the fitted model depends on."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"params": XGB_PARAMS, "features": list(X.columns),
+                         "xgboost": xgb.__version__}, sort_keys=True).encode())
+    h.update(np.ascontiguousarray(X.to_numpy(dtype=np.float32)).tobytes())
+    h.update("\n".join(y.astype(str)).encode())
+    return h.hexdigest()
 
-# ------------------------------------------------------------------#
-# 4. Numeric columns
-# ------------------------------------------------------------------#
-df["thc"] = pct_to_float(df["thc_level"].astype(str).str.extract(r"(\d+\.?\d*)")[0])
-if "cbd" in df.columns:
-    df["cbd"] = pd.to_numeric(df["cbd"], errors="coerce").fillna(0.0)
-else:
-    df["cbd"] = 0.0
+def load_cached_model(key: str):
+    """``(model, label_encoder)`` saved for ``key``, or None."""
+    if not all(os.path.exists(p) for p in (MODEL_META_PATH, MODEL_PATH, ENCODER_PATH)):
+        return None
+    with open(MODEL_META_PATH, encoding="utf-8") as f:
+        if json.load(f).get("training_key") != key:
+            return None
+    return joblib.load(MODEL_PATH), joblib.load(ENCODER_PATH)
 
 # ------------------------------------------------------------------#
-# 5. Dominant terpene column
+# Main
 # ------------------------------------------------------------------#
-terp_col = "most_common_terpene" if "most_common_terpene" in df.columns else "dominant_terpene"
-df["dominant_terpene"] = (
-    df.get(terp_col, "unknown")
-      .astype(str).str.lower()
-      .str.replace("\u03b2-", "beta-", regex=False)
-      .fillna("unknown")
-)
+def run(args):
+    os.makedirs(MODEL_DIR, exist_ok=True)
 
-# ------------------------------------------------------------------#
-# 6. Build training set for terpene imputation
-# ------------------------------------------------------------------#
-train_df = df[df["dominant_terpene"] != "unknown"].copy()
-top_terps = train_df["dominant_terpene"].value_counts()
-train_df  = train_df[train_df["dominant_terpene"].isin(top_terps[top_terps >= 10].index)]
-
-skip = {
-    "name", "strain_name", "description", "thc_level",
-    "dominant_terpene", "most_common_terpene",
-    "aggressive_cleaned_description", "thc", "cbd"
-}
-effect_cols = []
-for col in train_df.columns.difference(skip):
-    try:
-        train_df[col] = pct_to_float(train_df[col])
-        effect_cols.append(col)
-    except Exception:
-        continue
+    # ------------------------------------------------------------------#
+    # 1. Declared schema for this file
+    # ------------------------------------------------------------------#
+    print(f"🔍 Loading → {INPUT_CSV}")
+    header  = read_header(INPUT_CSV)
+    columns = [c for c in header if c not in DROP_COLUMNS]
+    if "description" not in columns:
+        raise ValueError(f"{INPUT_CSV} has no description column")
+    effect_cols = sorted(c for c in EFFECT_COLUMNS if c in columns)
+    extra = [c for c in columns if c not in EFFECT_COLUMNS and c not in TERPENE_COLUMNS
+             and c not in DERIVED_COLUMNS and c not in ("name", "type", "thc_level", "description")]
+    if extra:
+        print(f"ℹ️ Undeclared columns kept as text: {', '.join(extra)}")
+    out_columns = columns + [c for c in DERIVED_COLUMNS if c not in columns]
+    schema = output_schema(out_columns)
+    features = effect_cols + ["thc", "cbd"]
 
-# ------------------------------------------------------------------#
-# 7. Train XGBoost model
-# ------------------------------------------------------------------#
-if effect_cols:
-    X     = train_df[effect_cols + ["thc", "cbd"]].astype(np.float32)
-    y     = train_df["dominant_terpene"]
-    le    = LabelEncoder().fit(y)
-    y_enc = le.transform(y)
-
-    X_tr, X_te, y_tr, y_te = train_test_split(
-        X, y_enc, stratify=y_enc, test_size=0.2, random_state=42
-    )
+    # ------------------------------------------------------------------#
+    # 2. Stream: clean, filter, type → staging parquet + training rows
+    # ------------------------------------------------------------------#
+    cache = TextCache()
+    if args.force:
+        cache.clear()
+    rows = kept = cleaned = 0
+    train_X, train_y = [], []
+    try:
+        with pq.ParquetWriter(STAGE_PAR, schema) as writer:
+            for raw in csv_batches(INPUT_CSV, columns, args.block_mb):
+                df, n_cleaned = type_batch(raw, rows, effect_cols, cache, args.workers)
+                rows, kept, cleaned = rows + len(raw), kept + len(df), cleaned + n_cleaned
+                writer.write_table(pa.Table.from_pandas(df[out_columns], schema=schema, preserve_index=False))
+                labelled = df[df["dominant_terpene"] != "unknown"]
+                train_X.append(labelled[features].to_numpy(dtype=np.float32))
+                train_y.append(labelled["dominant_terpene"].to_numpy(dtype=object))
+        pruned = cache.prune()
+    finally:
+        cache.close()
+    print(f"🧼 Cleaned {cleaned:,} new/changed rows ({rows - cleaned:,} from cache, {pruned:,} stale pruned)")
+    print(f"🧹 Dropped {rows - kept:,} rows with empty/short descriptions")
 
-    model = xgb.XGBClassifier(
-        eval_metric="mlogloss",
-        max_depth=6,
-        n_estimators=300,
-        learning_rate=0.15,
-        subsample=0.8,
-        random_state=42
-    )
-    model.fit(X_tr, y_tr)
+    # ------------------------------------------------------------------#
+    # 3. Build training set for terpene imputation
+    # ------------------------------------------------------------------#
+    X = pd.DataFrame(np.concatenate(train_X) if train_X else np.empty((0, len(features)), np.float32),
+                     columns=features)
+    y = pd.Series(np.concatenate(train_y) if train_y else np.empty(0, dtype=object))
+    top_terps = y.value_counts()
+    common = y.isin(top_terps[top_terps >= 10].index).to_numpy()
+    X, y = X[common].reset_index(drop=True), y[common].reset_index(drop=True)
 
     # ------------------------------------------------------------------#
-    # 8. Impute missing terpenes
+    # 4. Train XGBoost model
     # ------------------------------------------------------------------#
-    for c in effect_cols:
-        df[c] = pct_to_float(df.get(c, 0.0))
+    model = None
+    if effect_cols:
+        key   = training_key(X, y)
+        cached = None if args.force else load_cached_model(key)
 
-    X_all = df[effect_cols + ["thc", "cbd"]].astype(np.float32)
-    df["dominant_terpene"] = le.inverse_transform(model.predict(X_all))
+        if cached:
+            model, le = cached
+            print("♻️ Training data unchanged — reusing saved XGBoost model.")
+        else:
+            le    = LabelEncoder().fit(y)
+            y_enc = le.transform(y)
 
-    # Save model artefacts
-    joblib.dump(model, os.path.join(MODEL_DIR, "xgb_terpene_predictor.pkl"))
-    joblib.dump(le,    os.path.join(MODEL_DIR, "terpene_label_encoder.pkl"))
-    print("💾 XGBoost model + label encoder saved.")
-else:
-    print("⚠️ No effect columns found — terpene imputation skipped.")
+            X_tr, X_te, y_tr, y_te = train_test_split(
+                X, y_enc, stratify=y_enc, test_size=0.2, random_state=42
+            )
 
-# ------------------------------------------------------------------#
-# 9. Save cleaned parquet
-# ------------------------------------------------------------------#
-df.to_parquet(OUTPUT_PAR, index=False)
-print(f"✅ Cleaned dataset saved → {OUTPUT_PAR}  ({len(df):,} rows)")
+            model = xgb.XGBClassifier(**XGB_PARAMS, n_jobs=args.workers or os.cpu_count())
+            model.fit(X_tr, y_tr)
+
+            # Save model artefacts (the key is written last: it vouches for both pickles)
+            if os.path.exists(MODEL_META_PATH):
+                os.remove(MODEL_META_PATH)
+            joblib.dump(model, MODEL_PATH)
+            joblib.dump(le,    ENCODER_PATH)
+            with open(MODEL_META_PATH, "w", encoding="utf-8") as f:
+                json.dump({"training_key": key, "features": features}, f, indent=2)
+            print("💾 XGBoost model + label encoder saved.")
+    else:
+        print("⚠️ No effect columns found — terpene imputation skipped.")
+
+    # ------------------------------------------------------------------#
+    # 5. Impute terpenes batch by batch → cleaned parquet
+    # ------------------------------------------------------------------#
+    if model is None:
+        os.replace(STAGE_PAR, OUTPUT_PAR)
+    else:
+        tmp = OUTPUT_PAR + ".tmp"
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for batch in pq.ParquetFile(STAGE_PAR).iter_batches():
+                df = batch.to_pandas()
+                df["dominant_terpene"] = le.inverse_transform(
+                    model.predict(df[features].astype(np.float32)))
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+        os.replace(tmp, OUTPUT_PAR)
+    print(f"✅ Cleaned dataset saved → {OUTPUT_PAR}  ({kept:,} rows)")
+
+def main():
+    args = parse_args()
+    try:
+        run(args)
+    finally:
+        # Partial output never replaces the previous parquet
+        for path in (STAGE_PAR, OUTPUT_PAR + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+if __name__ == "__main__":
+    main()
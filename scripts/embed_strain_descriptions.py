@@ -1,47 +1,107 @@
 """
-Embed cleaned strain descriptions into OpenAI vectors and save a
-compressed parquet file ready for FAISS indexing.
+Embed cleaned strain descriptions into append-only parquet shards
+(data/embeddings/) ready for FAISS indexing.
+
+Descriptions are split into windows of ``--chunk-size`` sentences
+(``--overlap`` shared between neighbours) by a pool of ``--workers``
+processes, ``--batch-rows`` strains per task. Chunk batches stream straight
+into the embedding stage and chunks.parquet as they are produced, so the
+corpus is never held in memory as Python records.
+
+The backend comes from EMBEDDING_BACKEND (openai by default; ``local`` runs
+fully offline on CPU), see utils/embeddings.py. Chunks are packed into
+multi-input requests and several requests are kept in flight; rate limits
+shrink the window and back off.
+
+Every ``--shard-rows`` embedded chunks are written as one shard and
+checkpointed in data/embeddings/manifest.json, so an interrupted run loses
+at most one shard's worth of work. Re-running resumes from the manifest:
+only shard keys are read, and chunks that already have a vector are skipped.
+
+Chunks are keyed by a hash of (model, normalised text): identical
+boilerplate is embedded once and shared, and renaming or reordering strains
+does not trigger re-embedding.
+
+    python scripts/embed_strain_descriptions.py --max-in-flight 8 --shard-rows 4096
+    python scripts/embed_strain_descriptions.py --chunk-size 3 --overlap 1 --workers 8
 """
 
 import os
+import sys
+import argparse
 import numpy as np
 import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from tqdm import tqdm
-import nltk
-from nltk.tokenize import sent_tokenize
-from openai import OpenAI
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.embeddings import OPENAI_MODEL, Embedder, embed_batched, get_embedder
+from utils import embedding_shards as shards
+from utils.embedding_cache import cache_key
+from utils.chunking import BATCH_ROWS, CHUNK_OVERLAP, CHUNK_SIZE, iter_chunks
+
 # === Config ===
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 CLEANED_PATH = os.path.join(ROOT_DIR, "data", "cleaned_strains.parquet")
+# Pre-shard output; imported as the first shard when resuming from it
 EMB_PATH = os.path.join(ROOT_DIR, "data", "docs_df_with_embeddings.parquet")
-CHUNK_SIZE = 2
-EMBED_MODEL = "text-embedding-3-small"
-
-# === Setup ===
-nltk.download("punkt", quiet=True)
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-tqdm.pandas()
+MAX_IN_FLIGHT = 8
+SHARD_ROWS = 4096
 
 # === Helpers ===
-def chunk_sentences(text: str, k: int = CHUNK_SIZE) -> list[str]:
-    if not isinstance(text, str) or not text.strip():
-        return []
-    sents = sent_tokenize(text)
-    return [" ".join(sents[i:i + k]) for i in range(0, len(sents), k)]
-
-def embed(text: str) -> list[float] | None:
-    try:
-        response = client.embeddings.create(input=[text], model=EMBED_MODEL)
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"❌ Embedding error for chunk: {text[:30]}… → {e}")
-        return None
+def parse_args():
+    parser = argparse.ArgumentParser(description="Embed cleaned strain descriptions.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="sentences per chunk")
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP,
+                        help="sentences shared by consecutive chunks of a description")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="sentence-tokenising processes (default: all cores, 1 = no pool)")
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="strains per chunking task")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="embedding requests sent concurrently (halved on rate limits)")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS,
+                        help="chunks per shard / checkpoint")
+    args = parser.parse_args()
+    if not 0 <= args.overlap < args.chunk_size:
+        parser.error("--overlap must be at least 0 and smaller than --chunk-size")
+    return args
+
+def import_legacy_embeddings(manifest: dict, embedder: Embedder) -> dict:
+    """Seed an empty shard set from docs_df_with_embeddings.parquet if it matches the backend."""
+    if not os.path.exists(EMB_PATH):
+        return manifest
+    has_model = "embedding_model" in pq.read_schema(EMB_PATH).names
+    old = pq.read_table(EMB_PATH, columns=["chunk", "embedding"] + (["embedding_model"] if has_model else []))
+    # Files written before pluggable backends were always OpenAI
+    old_model = old.column("embedding_model")[0].as_py() if has_model and len(old) else OPENAI_MODEL
+    old = old.filter(pc.and_(pc.is_valid(old.column("chunk")), pc.is_valid(old.column("embedding"))))
+    if old_model != embedder.name or not len(old):
+        return manifest
+    keys = pd.Series([cache_key(text, embedder.name) for text in old.column("chunk").to_pylist()])
+    first = ~keys.duplicated().to_numpy()
+    print(f"📥 Importing {int(first.sum())} embeddings from {EMB_PATH}")
+    vectors = shards.arrow_to_matrix(old.column("embedding"))
+    return shards.append_shard(manifest, keys[first], vectors[first])
+
+def resume_manifest(embedder: Embedder) -> dict:
+    """Shard manifest to continue from (vectors from another backend are not comparable)."""
+    manifest = shards.load_manifest()
+    if manifest["shards"] and (manifest["embedding_model"] != embedder.name
+                               or manifest.get("key") != shards.KEY_COLUMN):
+        print(f"♻️ Existing shards are from {manifest['embedding_model']} "
+              f"keyed by {manifest.get('key', 'strain/chunk')} — re-embedding everything.")
+        return shards.reset(embedder.name)
+    if not manifest["shards"]:
+        return import_legacy_embeddings(shards.reset(embedder.name), embedder)
+    return manifest
 
 # === Main ===
 def main():
+    args = parse_args()
+    load_dotenv()
+    embedder = get_embedder()
     print(f"🔍 Loading → {CLEANED_PATH}")
     if not os.path.exists(CLEANED_PATH):
         raise FileNotFoundError(f"Missing: {CLEANED_PATH}")
@@ -52,46 +112,55 @@ def main():
     df = df.fillna("")
     df["effects"] = df.get("effects", "")
     df["dominant_terpene"] = df.get("dominant_terpene", "unknown")
-    df["chunks"] = df["aggressive_cleaned_description"].progress_apply(chunk_sentences)
-
-    # Flatten
-    records = []
-    for sid, (name, chunks, effects, terp) in enumerate(zip(df["strain_name"], df["chunks"], df["effects"], df["dominant_terpene"])):
-        for idx, chunk in enumerate(chunks):
-            if chunk.strip():
-                records.append({
-                    "strain_id": sid,
-                    "strain_name": name,
-                    "chunk_index": idx,
-                    "chunk": chunk,
-                    "effects": effects,
-                    "dominant_terpene": terp
-                })
-
-    docs = pd.DataFrame(records)
-    print(f"📄 {len(docs)} chunks ready for embedding.")
-
-    # Resume from existing
-    if os.path.exists(EMB_PATH):
-        old = pd.read_parquet(EMB_PATH)
-        if {"strain_name", "chunk_index", "embedding"}.issubset(old.columns):
-            docs = docs.merge(old[["strain_name", "chunk_index", "embedding"]],
-                              on=["strain_name", "chunk_index"], how="left")
-        else:
-            docs["embedding"] = None
-    else:
-        docs["embedding"] = None
-
-    # Embed
-    to_embed = docs["embedding"].isna()
-    print(f"➡️ Embedding {to_embed.sum()} chunks …")
-    if to_embed.any():
-        docs.loc[to_embed, "embedding"] = docs.loc[to_embed, "chunk"].progress_apply(embed)
-
-    docs.dropna(subset=["embedding"], inplace=True)
-    docs["embedding"] = docs["embedding"].apply(lambda x: np.array(x, dtype=np.float32).tolist())
-    docs.to_parquet(EMB_PATH, index=False, compression="snappy")
-    print(f"✅ Saved → {EMB_PATH} (compressed)")
+    # Strain attributes carried onto every chunk for filtered search
+    df["type"] = df.get("type", "")
+    df["thc"] = pd.to_numeric(df.get("thc", 0.0), errors="coerce")
+    df["cbd"] = pd.to_numeric(df.get("cbd", 0.0), errors="coerce")
+
+    manifest = resume_manifest(embedder)
+    done = shards.shard_keys(manifest)
+    print(f"✂️ Chunking {len(df)} strains ({args.chunk_size} sentences, overlap {args.overlap}) "
+          f"and embedding with {embedder.name}; {len(done)} texts already in {len(manifest['shards'])} shards …")
+
+    # Chunks stream from the tokeniser pool in strain batches; each distinct
+    # text not already in a shard is queued and embedded one shard at a time.
+    seen, queued_keys, queued_texts = set(), [], []
+    n_chunks = n_embedded = failed = 0
+
+    def flush(rows: int):
+        nonlocal n_embedded, failed
+        keys, texts = queued_keys[:rows], queued_texts[:rows]
+        del queued_keys[:rows], queued_texts[:rows]
+        vectors, ok = embed_batched(texts, embedder, args.max_in_flight)
+        failed += int((~ok).sum())
+        n_embedded += int(ok.sum())
+        if ok.any():
+            shards.append_shard(manifest, np.asarray(keys, dtype=object)[ok],
+                                vectors if ok.all() else vectors[ok])
+
+    with shards.ChunkWriter() as writer, tqdm(total=len(df), unit="strain") as bar:
+        for n_rows, docs in iter_chunks(df, args.chunk_size, args.overlap, args.batch_rows, args.workers):
+            docs[shards.KEY_COLUMN] = [cache_key(text, embedder.name) for text in docs["chunk"]]
+            writer.write(docs)
+            n_chunks += len(docs)
+            fresh = docs.drop_duplicates(shards.KEY_COLUMN)
+            fresh = fresh[[key not in seen for key in fresh[shards.KEY_COLUMN]]]
+            seen.update(fresh[shards.KEY_COLUMN])
+            fresh = fresh[~fresh[shards.KEY_COLUMN].isin(done)]
+            queued_keys.extend(fresh[shards.KEY_COLUMN])
+            queued_texts.extend(fresh["chunk"])
+            while len(queued_keys) >= args.shard_rows:
+                flush(args.shard_rows)
+            bar.update(n_rows)
+            bar.set_postfix(chunks=n_chunks, embedded=n_embedded)
+        if queued_keys:
+            flush(len(queued_keys))
+
+    print(f"📄 {n_chunks} chunks ({len(seen)} distinct texts, dedup ratio "
+          f"{1 - len(seen) / max(n_chunks, 1):.1%}); {n_embedded} embedded this run.")
+    if failed:
+        print(f"⚠️ {failed} texts failed to embed; re-run to retry them.")
+    print(f"✅ Saved → {shards.SHARDS_DIR} ({len(manifest['shards'])} shards)")
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,8 @@
 import requests
 from bs4 import BeautifulSoup
 
+from scripts.scrapers.errors import PageNotFound
+
 def scrape_allbud(url: str) -> dict:
     result = {
         "description": "",
@@ -10,7 +12,9 @@ def scrape_allbud(url: str) -> dict:
         "aromas": []
     }
     try:
-        r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
+        r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+        if r.status_code == 404:
+            raise PageNotFound(url)
         soup = BeautifulSoup(r.text, "html.parser")
 
         desc = soup.find("div", class_="strain-info")
@@ -32,5 +36,7 @@ def scrape_allbud(url: str) -> dict:
             result["aromas"] = get_section("Aromas")
 
         return result
+    except PageNotFound:
+        raise
     except:
         return result
@@ -0,0 +1,2 @@
+class PageNotFound(Exception):
+    """The source has no page at this URL (HTTP 404); cached as a miss by the scrape cache."""
@@ -2,12 +2,16 @@ import requests
 from bs4 import BeautifulSoup
 import re
 
+from scripts.scrapers.errors import PageNotFound
+
 def scrape_leafly(url: str) -> dict:
     headers = {"User-Agent": "Mozilla/5.0"}
     result = {"feelings": [], "helps_with": [], "negatives": [], "terpenes": [], "description": ""}
 
     try:
         r = requests.get(url, headers=headers, timeout=10)
+        if r.status_code == 404:
+            raise PageNotFound(url)
         soup = BeautifulSoup(r.text, "html.parser")
         ul = soup.find("ul", class_="flex flex-col gap-sm")
         if ul:
@@ -25,5 +29,7 @@ def scrape_leafly(url: str) -> dict:
                     elif "terpenes" in label.lower():
                         result["terpenes"] = parsed
         return result
+    except PageNotFound:
+        raise
     except:
         return result
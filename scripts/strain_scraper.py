@@ -1,8 +1,30 @@
 # scripts/strain_scraper.py
 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from scripts.scrapers.errors import PageNotFound
 from scripts.scrapers.leafly import scrape_leafly
 from scripts.scrapers.allbud import scrape_allbud
 from scripts.scrapers.weedmaps import scrape_weedmaps
+from utils.scrape_cache import ScrapeCache, get_cache
+
+# Source name → (URL field on a strain row, scraper); also the merge order
+SOURCES = {
+    "leafly": ("leafly_url", scrape_leafly),
+    "allbud": ("allbud_url", scrape_allbud),
+    "weedmaps": ("weedmaps_url", scrape_weedmaps),
+}
+# Seconds to wait for each source (Weedmaps drives a headless browser)
+SOURCE_TIMEOUTS = {"leafly": 12, "allbud": 12, "weedmaps": 30}
+MAX_WORKERS = 16
+REFRESH_WORKERS = 4
+
+# Stale-while-revalidate refreshes outlive the page run that started them
+_REFRESH_POOL = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="scrape-refresh")
+_REFRESHING = set()
+_REFRESH_LOCK = threading.Lock()
 
 
 def merge_sources(*sources):
@@ -31,13 +53,130 @@ def merge_sources(*sources):
     return merged
 
 
+def fetch_source(source: str, url: str, cache: ScrapeCache = None) -> dict:
+    """Scrape one source page, recording the outcome in ``cache``."""
+    try:
+        data = SOURCES[source][1](url) or {}
+    except PageNotFound:
+        if cache is not None:
+            cache.put(url, source, "not_found")
+        raise
+    if cache is not None:
+        cache.put(url, source, "ok" if any(data.values()) else "empty", data)
+    return data
+
+
+def refresh_in_background(source: str, url: str, cache: ScrapeCache):
+    """Re-scrape a stale page without waiting for it; one refresh per URL at a time."""
+    with _REFRESH_LOCK:
+        if url in _REFRESHING:
+            return
+        _REFRESHING.add(url)
+
+    def run():
+        try:
+            fetch_source(source, url, cache)
+        except Exception as e:
+            print(f"[Scraper] background refresh of {source} failed for {url}: {e}")
+        finally:
+            with _REFRESH_LOCK:
+                _REFRESHING.discard(url)
+
+    _REFRESH_POOL.submit(run)
+
+
+def iter_scrape_batch(strains: dict, timeouts: dict = None, max_workers: int = MAX_WORKERS,
+                      cache: ScrapeCache = None, use_cache: bool = True):
+    """
+    Scrape every source of every strain concurrently.
+
+    ``strains`` maps a caller key to a row-like dict with ``leafly_url`` /
+    ``allbud_url`` / ``weedmaps_url`` (missing or empty URLs are skipped).
+    Yields ``(key, source, merged)`` as each request finishes, where
+    ``merged`` combines that strain's finished sources in ``SOURCES`` order.
+    A source still running after its timeout is given up on (and yielded
+    with nothing new), so the batch takes as long as the slowest request,
+    capped by the largest timeout.
+
+    Pages in the scrape cache (``utils/scrape_cache.py``) are yielded first
+    without a request; stale ones are refreshed in the background, and 404s
+    and timeouts are remembered so they are not retried on every rerun.
+    """
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+    jobs = [(key, source, strain.get(field))
+            for key, strain in strains.items()
+            for source, (field, _) in SOURCES.items() if strain.get(field)]
+    if not jobs:
+        return
+
+    if use_cache and cache is None:
+        cache = get_cache()
+    cached = cache.lookup(url for _, _, url in jobs) if cache is not None else {}
+    parts = {key: {} for key in strains}
+
+    def merged(key):
+        return merge_sources(*(parts[key][s] for s in SOURCES if s in parts[key]))
+
+    live = []
+    for key, source, url in jobs:
+        if url not in cached:
+            live.append((key, source, url))
+            continue
+        state, data = cached[url]
+        if state == "stale":
+            refresh_in_background(source, url, cache)
+        parts[key][source] = data
+        yield key, source, merged(key)
+    if not live:
+        return
+
+    pool = ThreadPoolExecutor(max_workers=min(len(live), max_workers))
+    try:
+        started = time.time()
+        start = time.monotonic()
+        pending = {pool.submit(fetch_source, source, url, cache): (key, source, url, start + timeouts[source])
+                   for key, source, url in live}
+        while pending:
+            next_deadline = min(deadline for *_, deadline in pending.values())
+            done, _ = wait(pending, timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(pending):
+                key, source, url, deadline = pending[future]
+                if future in done:
+                    try:
+                        parts[key][source] = future.result()
+                    except PageNotFound:
+                        print(f"[Scraper] {source} has no page for {key}: {url}")
+                    except Exception as e:
+                        print(f"[Scraper] {source} failed for {key}: {e}")
+                elif now >= deadline:
+                    future.cancel()
+                    if cache is not None:
+                        # Unless the request finishes after all, in which case its result wins
+                        cache.put(url, source, "timeout", started=started)
+                    print(f"[Scraper] {source} timed out for {key} after {timeouts[source]}s")
+                else:
+                    continue
+                del pending[future]
+                yield key, source, merged(key)
+    finally:
+        # Timed-out requests finish (and fill the cache) in the background; nobody waits for them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def scrape_batch(strains: dict, timeouts: dict = None, use_cache: bool = True) -> dict:
+    """Merged scrape results for every key of ``strains`` (empty dict if nothing came back)."""
+    results = {key: {} for key in strains}
+    for key, _, merged in iter_scrape_batch(strains, timeouts, use_cache=use_cache):
+        results[key] = merged
+    return results
+
+
 def scrape_all_sources(leafly_url=None, allbud_url=None, weedmaps_url=None):
     """
     Scrapes strain data from multiple sources and merges them.
     Skips any source where a URL is not provided.
     """
-    leafly_data = scrape_leafly(leafly_url) if leafly_url else {}
-    allbud_data = scrape_allbud(allbud_url) if allbud_url else {}
-    weedmaps_data = scrape_weedmaps(weedmaps_url) if weedmaps_url else {}
-
-    return merge_sources(leafly_data, allbud_data, weedmaps_data)
+    strain = {"leafly_url": leafly_url, "allbud_url": allbud_url, "weedmaps_url": weedmaps_url}
+    return scrape_batch({0: strain})[0]
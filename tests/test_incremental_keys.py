@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from utils import faiss_utils
+from utils.faiss_utils import build_metadata, diff_chunks
+
+def catalogue(names, chunks_per_strain=3):
+    """Chunk frame as embed_strain_descriptions.py writes it (strain_id = catalogue row)."""
+    rows = []
+    for position, name in enumerate(names):
+        for i in range(chunks_per_strain):
+            rows.append({"strain_id": position, "strain_name": name, "chunk_index": i,
+                         "chunk": f"{name} sentence {i}.", "effects": "", "dominant_terpene": "myrcene",
+                         "type": "hybrid", "thc": 20.0, "cbd": 0.0})
+    return pd.DataFrame(rows)
+
+def test_removing_a_middle_strain_only_removes_its_chunks():
+    names = ["Blue Dream", "OG Kush", "Sour Diesel", "Gelato", "Blue Dream"]
+    old = build_metadata(catalogue(names))
+    new = build_metadata(catalogue(names[:2] + names[3:]))  # every later row shifts up
+
+    pos, added, changed, removed = diff_chunks(old["chunk_key"].to_numpy(), old["content_hash"].to_numpy(), new)
+    assert not added.any() and not changed.any()
+    assert set(old.loc[removed, "strain_name"]) == {"Sour Diesel"}
+    assert removed.sum() == 3
+    # Surviving chunks keep their strain ids, so grouping and centroids stay put
+    assert (old["strain_id"].to_numpy()[pos] == new["strain_id"].to_numpy()).all()
+
+def test_strain_keys_ignore_case_and_spacing_and_split_repeated_names():
+    keys = faiss_utils.strain_keys(["Blue  Dream", "blue dream", "Gelato"], [0, 1, 2])
+    assert keys[0] != keys[1]   # same name twice: two strains
+    assert keys[0] == faiss_utils.strain_keys(["BLUE DREAM"], [7])[0]
+
+def test_filter_columns_join_by_strain_not_row(tmp_path, monkeypatch):
+    cleaned = pd.DataFrame({"strain_name": ["OG Kush", "Gelato"], "type": ["indica", "hybrid"],
+                            "thc": [24.0, 18.0], "cbd": [0.1, 0.2]})
+    cleaned.to_parquet(tmp_path / "cleaned.parquet")
+    monkeypatch.setattr(faiss_utils, "CLEANED_PATH", str(tmp_path / "cleaned.parquet"))
+    # Chunks embedded before "Sour Diesel" was dropped from between them
+    chunks = catalogue(["OG Kush", "Sour Diesel", "Gelato"]).drop(columns=["type", "thc", "cbd"])
+    chunks = chunks[chunks["strain_name"] != "Sour Diesel"]
+    meta = build_metadata(chunks)
+    assert meta.groupby("strain_name")["type"].first().to_dict() == {"OG Kush": "indica", "Gelato": "hybrid"}
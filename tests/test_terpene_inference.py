@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import LabelEncoder
+
+from utils import terpene_inference
+from utils.terpene_inference import TerpenePredictor
+
+FEATURES = ["relaxed", "thc"]
+
+def fit_predictor(labels):
+    """Predictor over a model where strains without features were labelled ``labels[-1]``."""
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.normal(0, 0.1, (40, 2)),                 # featureless → placeholder label
+                   rng.normal([1, 20], 0.1, (40, 2)),
+                   rng.normal([-1, 5], 0.1, (40, 2))])
+    y = [labels[-1]] * 40 + [labels[0]] * 40 + [labels[1 % len(labels)]] * 40
+    encoder = LabelEncoder().fit(y)
+    model = LogisticRegression(max_iter=1000).fit(pd.DataFrame(X, columns=FEATURES), encoder.transform(y))
+    return TerpenePredictor(model, encoder, FEATURES)
+
+def test_placeholder_class_is_never_predicted():
+    predictor = fit_predictor(["myrcene", "limonene", "nan"])
+    rows = pd.DataFrame({"relaxed": [0.0, 0.0, 1.0, -1.0], "thc": [0.0, 0.1, 20.0, 5.0]})
+    predicted = predictor.predict(rows)
+    assert "nan" not in set(predicted["dominant_terpene"])
+    assert predicted["dominant_terpene"].isin(["myrcene", "limonene"]).all()
+    # Renormalised over the real terpenes only
+    assert (predicted["probability"] > 0.5).all() and (predicted["probability"] <= 1.0).all()
+    assert predicted.loc[2, "dominant_terpene"] == "myrcene"
+
+def test_no_prediction_without_a_real_class():
+    predictor = fit_predictor(["unknown", "nan"])
+    predicted = predictor.predict(pd.DataFrame({"relaxed": [0.0, 1.0], "thc": [0.0, 20.0]}))
+    assert predicted["dominant_terpene"].isna().all()
+    assert predicted["probability"].isna().all()
+
+def test_infer_missing_terpenes_skips_rows_without_a_prediction(monkeypatch):
+    predictor = fit_predictor(["unknown", "nan"])
+    monkeypatch.setattr(terpene_inference, "get_predictor", lambda: predictor)
+    monkeypatch.setattr(terpene_inference, "_catalogue_features",
+                        lambda features: pd.DataFrame(columns=features))
+    rows = pd.DataFrame({"strain_name": ["a"], "dominant_terpene": ["nan"], "relaxed": [0.0], "thc": [0.0]})
+    assert terpene_inference.infer_missing_terpenes(rows).empty
@@ -0,0 +1,112 @@
+# === utils/chunking.py ===
+"""
+Streaming sentence chunking for the embedding pipeline.
+
+Strain rows are split into batches and tokenised with NLTK across a process
+pool. ``iter_chunks`` yields one DataFrame of chunk records per batch, in
+row order, keeping only a bounded number of batches in flight, so chunking
+scales with cores and the corpus is never held as a list of Python dicts.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import nltk
+from nltk.tokenize import sent_tokenize
+
+CHUNK_SIZE = 2       # sentences per chunk
+CHUNK_OVERLAP = 0    # sentences shared by consecutive chunks
+BATCH_ROWS = 256     # strains per worker task
+# Attributes carried from the strain onto every chunk (filtered search, re-ranking)
+CHUNK_COLUMNS = ["strain_name", "effects", "dominant_terpene", "type", "thc", "cbd"]
+TEXT_COLUMN = "aggressive_cleaned_description"
+
+PUNKT_RESOURCE = "punkt_tab"  # sentence tokenizer data read by sent_tokenize
+
+_PUNKT_READY = []
+
+
+def ensure_punkt():
+    """Check the NLTK sentence tokenizer data is installed, downloading it at most once.
+
+    Runs in the parent before any pool starts (workers only read the data),
+    and fails with instructions instead of a LookupError mid-run when the
+    data is missing and cannot be downloaded.
+    """
+    if _PUNKT_READY:
+        return
+    try:
+        nltk.data.find(f"tokenizers/{PUNKT_RESOURCE}")
+    except LookupError:
+        print(f"⬇️ Downloading NLTK {PUNKT_RESOURCE} …")
+        try:
+            ok = nltk.download(PUNKT_RESOURCE, quiet=True, raise_on_error=True)
+        except Exception as e:
+            ok, error = False, e
+        else:
+            error = None
+        if not ok:
+            raise RuntimeError(
+                f"NLTK '{PUNKT_RESOURCE}' data is missing and could not be downloaded ({error or 'offline?'}). "
+                f"Install it once with `python -m nltk.downloader {PUNKT_RESOURCE}` or point NLTK_DATA at a copy."
+            )
+    _PUNKT_READY.append(True)
+
+
+def chunk_sentences(text: str, k: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Windows of ``k`` sentences, consecutive windows sharing ``overlap`` sentences."""
+    if not isinstance(text, str) or not text.strip():
+        return []
+    if not 0 <= overlap < k:
+        raise ValueError(f"overlap must be in [0, {k}), got {overlap}")
+    sents = sent_tokenize(text)
+    step = k - overlap
+    last = max(len(sents) - overlap, 1)  # no trailing window made only of overlap
+    return [" ".join(sents[i:i + k]) for i in range(0, last, step)]
+
+
+def chunk_records(rows: pd.DataFrame, start_id: int, k: int = CHUNK_SIZE,
+                  overlap: int = CHUNK_OVERLAP) -> pd.DataFrame:
+    """Chunk records for ``rows``; ``strain_id`` is the row position, offset by ``start_id``."""
+    chunks = [[c for c in chunk_sentences(text, k, overlap) if c.strip()] for text in rows[TEXT_COLUMN]]
+    counts = np.fromiter((len(c) for c in chunks), dtype=np.int64, count=len(chunks))
+    owner = np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+    records = rows[CHUNK_COLUMNS].iloc[owner].reset_index(drop=True)
+    records.insert(0, "strain_id", owner + start_id)
+    records.insert(2, "chunk_index", np.arange(len(owner), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts))
+    records.insert(3, "chunk", pd.Series([c for strain in chunks for c in strain], dtype=object))
+    return records
+
+
+def _chunk_task(args):
+    return chunk_records(*args)
+
+
+def iter_chunks(df: pd.DataFrame, k: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                batch_rows: int = BATCH_ROWS, workers: int = None):
+    """Yield ``(n_rows, records)`` per batch of ``batch_rows`` strains, in order.
+
+    With ``workers`` > 1 batches are tokenised in a process pool with at most
+    ``2 * workers`` batches pending, so a slow consumer (the embedding stage)
+    applies back-pressure instead of letting results pile up.
+    """
+    ensure_punkt()
+    df = df[[TEXT_COLUMN] + CHUNK_COLUMNS]
+    tasks = ((df.iloc[lo:lo + batch_rows], lo, k, overlap) for lo in range(0, len(df), batch_rows))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            yield len(task[0]), chunk_records(*task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for task in tasks:
+            pending.append((len(task[0]), pool.submit(_chunk_task, task)))
+            if len(pending) >= 2 * workers:
+                n, future = pending.pop(0)
+                yield n, future.result()
+        for n, future in pending:
+            yield n, future.result()
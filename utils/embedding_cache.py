@@ -0,0 +1,111 @@
+# === utils/embedding_cache.py ===
+"""
+Persistent query-embedding cache shared by every page and worker.
+
+Vectors are stored as raw float32 blobs in a local SQLite database keyed by
+a hash of (model, normalised text). WAL mode lets several Streamlit workers
+read and write concurrently; the least recently used rows are evicted once
+the cache grows past ``max_entries``.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(ROOT, "data", "cache", "embeddings.sqlite"))
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+EVICT_EVERY = 100  # puts between size checks
+
+
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._puts = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL,"
+                " vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # SQLite connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, text: str, model: str):
+        key = cache_key(text, model)
+        conn = self._conn()
+        row = conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def put(self, text: str, model: str, vector):
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                (cache_key(text, model), model, int(vector.size), vector.tobytes(), time.time()),
+            )
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used rows beyond ``max_entries``."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def get_or_compute(self, text: str, model: str, compute):
+        """Cached vector for ``text``, calling ``compute(text)`` only on a miss."""
+        vector = self.get(text, model)
+        if vector is None:
+            vector = np.asarray(compute(text), dtype=np.float32)
+            self.put(text, model, vector)
+        return vector
+
+
+_CACHE = []
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    """Process-wide cache instance (the database itself is shared across processes)."""
+    with _CACHE_LOCK:
+        if not _CACHE:
+            _CACHE.append(EmbeddingCache())
+        return _CACHE[0]
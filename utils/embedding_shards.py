@@ -0,0 +1,196 @@
+# === utils/embedding_shards.py ===
+"""
+Append-only embedding shards written by embed_strain_descriptions.py.
+
+data/embeddings/ holds:
+
+    chunks.parquet          every chunk of the current catalogue (no vectors), written in batches
+    shard-00000.parquet …   embedding_key + embedding (fixed_size_list<float32>), one per checkpoint
+    manifest.json           completed shards and the embedding model
+
+Vectors are keyed by ``embedding_key``, a hash of (model, normalised text)
+(see ``utils.embedding_cache.cache_key``), so each distinct text is embedded
+once and fanned out to every chunk that shares it, and renaming or
+reordering strains never invalidates a vector.
+
+A shard is listed in the manifest only after it has been fully written, so a
+crash loses at most the batch in progress. Resuming reads the manifest and
+the key column of each shard, never the vectors. The index builder streams
+shards straight into a preallocated matrix (``load_shards``): the
+fixed-size-list column's values buffer is viewed as an (n, dim) array, so no
+per-row Python objects are created on either side.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SHARDS_DIR = os.path.join(ROOT, "data", "embeddings")
+MANIFEST_PATH = os.path.join(SHARDS_DIR, "manifest.json")
+CHUNKS_PATH = os.path.join(SHARDS_DIR, "chunks.parquet")
+KEY_COLUMN = "embedding_key"
+
+
+def _atomic_write(path: str, writer):
+    tmp = path + ".tmp"
+    writer(tmp)
+    os.replace(tmp, path)
+
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {"embedding_model": None, "key": KEY_COLUMN, "shards": []}
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    _atomic_write(MANIFEST_PATH, write)
+
+
+def reset(embedding_model: str) -> dict:
+    """Start an empty manifest for ``embedding_model`` and delete the old shards."""
+    old = load_manifest()
+    manifest = {"embedding_model": embedding_model, "key": KEY_COLUMN, "shards": []}
+    save_manifest(manifest)
+    for shard in old["shards"]:
+        path = os.path.join(SHARDS_DIR, shard["file"])
+        if os.path.exists(path):
+            os.remove(path)
+    return manifest
+
+
+class ChunkWriter:
+    """Write the current catalogue to chunks.parquet one batch at a time.
+
+    Batches go to a temporary file that replaces chunks.parquet only when the
+    writer closes cleanly, so an interrupted run leaves the previous catalogue
+    in place. Rows without a shard vector are skipped at build time.
+    """
+
+    def __init__(self):
+        os.makedirs(SHARDS_DIR, exist_ok=True)
+        self.tmp = CHUNKS_PATH + ".tmp"
+        self.writer = None
+        self.rows = 0
+
+    def write(self, docs: pd.DataFrame):
+        if docs.empty:
+            return
+        table = pa.Table.from_pandas(docs, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp, table.schema)
+        # Later batches may infer narrower types (e.g. an all-null column)
+        self.writer.write_table(table.cast(self.writer.schema))
+        self.rows += len(docs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.writer is not None:
+            self.writer.close()
+        if exc_type is None and self.writer is not None:
+            os.replace(self.tmp, CHUNKS_PATH)
+        elif os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def shard_keys(manifest: dict) -> pd.Index:
+    """Keys of every completed shard (embeddings are not read)."""
+    keys = [pq.read_table(os.path.join(SHARDS_DIR, s["file"]), columns=[KEY_COLUMN]).column(KEY_COLUMN)
+            for s in manifest["shards"]]
+    return pd.Index(np.concatenate([k.to_numpy() for k in keys]) if keys else [], dtype=object)
+
+
+def matrix_to_arrow(vectors: np.ndarray) -> pa.FixedSizeListArray:
+    """(n, dim) float32 matrix as a fixed_size_list<float32> array (zero-copy)."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return pa.FixedSizeListArray.from_arrays(pa.array(vectors.reshape(-1)), vectors.shape[1])
+
+
+def arrow_to_matrix(column) -> np.ndarray:
+    """(n, dim) float32 matrix from a list / fixed-size-list Arrow column.
+
+    A single-chunk float32 fixed-size-list column is a zero-copy view of its
+    values buffer; anything else is flattened with one vectorised copy.
+    """
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    parts = []
+    for chunk in chunks:
+        values = chunk.flatten()  # respects slice offsets, no per-row objects
+        if values.null_count:
+            raise ValueError("Embedding column contains null values")
+        if pa.types.is_fixed_size_list(chunk.type):
+            dim = chunk.type.list_size
+        else:
+            lengths = pc.list_value_length(chunk).to_numpy(zero_copy_only=False)
+            if len(lengths) and lengths.min() != lengths.max():
+                raise ValueError("Embeddings have inconsistent dimensions")
+            dim = int(lengths[0]) if len(lengths) else 0
+        parts.append(values.to_numpy(zero_copy_only=False).astype(np.float32, copy=False).reshape(len(chunk), dim))
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+
+def append_shard(manifest: dict, keys, vectors: np.ndarray) -> dict:
+    """Write one shard (one vector per key) and checkpoint it in the manifest."""
+    n = len(manifest["shards"])
+    name = f"shard-{n:05d}.parquet"
+    table = pa.table({KEY_COLUMN: pa.array(np.asarray(keys, dtype=object), pa.string()),
+                      "embedding": matrix_to_arrow(vectors)})
+    os.makedirs(SHARDS_DIR, exist_ok=True)
+    _atomic_write(os.path.join(SHARDS_DIR, name), lambda tmp: pq.write_table(table, tmp))
+    manifest["shards"].append({"file": name, "rows": len(keys)})
+    save_manifest(manifest)
+    return manifest
+
+
+def load_shards(manifest: dict = None):
+    """``(chunks, matrix)`` for every catalogue chunk that has a vector, in catalogue order.
+
+    Each shard's vectors are flattened from Arrow and fanned out into the rows
+    of every chunk sharing their key in one preallocated matrix, so peak
+    memory is about one matrix plus one shard.
+    """
+    manifest = manifest or load_manifest()
+    chunks = pd.read_parquet(CHUNKS_PATH)
+    chunk_code, unique_keys = pd.factorize(chunks[KEY_COLUMN])
+    unique_keys = pd.Index(unique_keys)
+    matrix, have = None, np.zeros(len(chunks), dtype=bool)
+    for shard in manifest["shards"]:
+        table = pq.read_table(os.path.join(SHARDS_DIR, shard["file"]))
+        pos = unique_keys.get_indexer(table.column(KEY_COLUMN).to_numpy())
+        vectors = arrow_to_matrix(table.column("embedding"))
+        if matrix is None:
+            matrix = np.empty((len(chunks), vectors.shape[1]), dtype=np.float32)
+        # Shard row holding each distinct key (-1 if not in this shard)
+        row_of_key = np.full(len(unique_keys), -1, dtype=np.int64)
+        found = pos >= 0
+        row_of_key[pos[found]] = np.flatnonzero(found)
+        rows = row_of_key[chunk_code]
+        hit = rows >= 0
+        matrix[hit] = vectors[rows[hit]]
+        have |= hit
+    if matrix is None:
+        return chunks.iloc[:0], np.empty((0, 0), dtype=np.float32)
+
+    # Close the gaps left by chunks without vectors, in place, block by block
+    rows = np.flatnonzero(have)
+    for lo in range(0, len(rows), 65536):
+        matrix[lo:lo + 65536] = matrix[rows[lo:lo + 65536]]
+    chunks = chunks.iloc[rows].reset_index(drop=True)
+    chunks["embedding_model"] = manifest.get("embedding_model")
+    return chunks, matrix[:len(rows)]
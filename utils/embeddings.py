@@ -1,26 +1,249 @@
 import os
-from functools import lru_cache
-import faiss, numpy as np
+import abc
+import json
+import time
+import zlib
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 from dotenv import load_dotenv
-from openai import OpenAI
 import pandas as pd
+from utils.embedding_cache import get_cache
+from utils.lexical import tokenize
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 INDEX_PATH     = os.path.join(ROOT, "vector_store", "index.faiss")
-METADATA_PATH  = os.path.join(ROOT, "vector_store", "docs_metadata.pkl")
+METADATA_PATH  = os.path.join(ROOT, "vector_store", "docs_metadata.arrow")
+INDEX_CONFIG_PATH = os.path.join(ROOT, "vector_store", "index_config.json")
 
-def get_embedding(text: str,
-                  model: str = "text-embedding-3-small") -> np.ndarray:
-    resp = client.embeddings.create(input=[text], model=model)
-    return np.asarray(resp.data[0].embedding, dtype=np.float32)
+DEFAULT_BACKEND = "openai"
+OPENAI_MODEL = "text-embedding-3-small"
+LOCAL_DIM = 1536  # same width as text-embedding-3-small, so artefacts are comparable
 
-@lru_cache
-def load_faiss() -> faiss.Index:
-    return faiss.read_index(INDEX_PATH)
+# === Providers ===
+class Embedder(abc.ABC):
+    """Embedding provider: ``name`` keys caches and artefacts, ``embed`` returns (n, dim) float32.
+
+    ``max_batch_inputs`` / ``max_batch_tokens`` bound a single ``embed`` call
+    (see ``embed_batched``).
+    """
+    name = "base"
+    max_batch_inputs = 256
+    max_batch_tokens = 100_000
+
+    @abc.abstractmethod
+    def embed(self, texts: list) -> np.ndarray:
+        ...
+
+class OpenAIEmbedder(Embedder):
+    # API limits are 2048 inputs and 300k tokens per request; stay under both
+    max_batch_inputs = 2048
+    max_batch_tokens = 250_000
+
+    def __init__(self, model: str = OPENAI_MODEL):
+        self.name = model
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use so the local backend works without an API key
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    def embed(self, texts: list) -> np.ndarray:
+        resp = self.client.embeddings.create(input=list(texts), model=self.name)
+        return np.asarray([d.embedding for d in resp.data], dtype=np.float32)
+
+class LocalHashEmbedder(Embedder):
+    """Offline CPU embedder: signed feature hashing of words + character n-grams.
+
+    No model download or network; sublinear term weights, L2-normalised rows.
+    Good enough for degraded-mode serving and for benchmarking retrieval
+    throughput without API latency in the way.
+    """
+
+    def __init__(self, dim: int = LOCAL_DIM, ngrams=(3, 4)):
+        self.dim = dim
+        self.ngrams = ngrams
+        self.name = f"local-hash-{dim}"
+
+    def _features(self, text) -> list:
+        words = tokenize(text)
+        feats = list(words)
+        for word in words:
+            padded = f" {word} "
+            for n in self.ngrams:
+                feats.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return feats
+
+    def embed(self, texts: list) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            feats = self._features(text)
+            if not feats:
+                continue
+            h = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint32, count=len(feats))
+            sign = np.where(h & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(out[row], (h & 0x7FFFFFFF) % self.dim, sign)
+        out = np.sign(out) * np.log1p(np.abs(out))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+BACKENDS = {
+    "openai": OpenAIEmbedder,
+    "local": LocalHashEmbedder,
+}
+_EMBEDDERS = {}
+
+def _store_backend():
+    """Backend that produced the vectors in the current store, if recorded."""
+    # Read the config file directly: embedding text offline never loads faiss or the retrieval layer
+    try:
+        with open(INDEX_CONFIG_PATH, encoding="utf-8") as f:
+            model = json.load(f).get("embedding_model")
+    except (OSError, ValueError):
+        return None
+    if not model:
+        return None
+    return "local" if model.startswith("local-hash") else "openai"
+
+def get_embedder(backend: str = None) -> Embedder:
+    """Shared provider for ``backend``.
+
+    Defaults to $EMBEDDING_BACKEND, then whichever backend built the vector
+    store, then OpenAI.
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND") or _store_backend() or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {tuple(BACKENDS)})")
+    if backend not in _EMBEDDERS:
+        _EMBEDDERS[backend] = BACKENDS[backend]()
+    return _EMBEDDERS[backend]
+
+def get_embedding(text: str, backend: str = None) -> np.ndarray:
+    """Query embedding, served from the persistent cache when seen before."""
+    embedder = get_embedder(backend)
+    return get_cache().get_or_compute(text, embedder.name, lambda t: embedder.embed([t])[0])
+
+# === Batched embedding ===
+def estimate_tokens(text: str) -> int:
+    """Upper-bound-ish token count (~3 characters per token) without a tokenizer."""
+    return len(text) // 3 + 1
+
+def pack_batches(texts: list, max_inputs: int, max_tokens: int) -> list:
+    """Split ``texts`` into contiguous ``(start, end)`` slices within both limits."""
+    batches, start, tokens = [], 0, 0
+    for i, text in enumerate(texts):
+        n = estimate_tokens(text)
+        if i > start and (i - start >= max_inputs or tokens + n > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+def _is_rate_limit(exc: Exception) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+def _retry_after(exc: Exception):
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class _AdaptiveWindow:
+    """In-flight request limit that halves on rate limits and creeps back up on success."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = limit
+        self.in_flight = 0
+        self.successes = 0
+        self.resume_at = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= self.size:
+                self.cond.wait()
+            self.in_flight += 1
+        pause = self.resume_at - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+
+    def release(self, rate_limited: bool = False, delay: float = 0.0):
+        with self.cond:
+            self.in_flight -= 1
+            if rate_limited:
+                self.size = max(1, self.size // 2)
+                self.successes = 0
+                self.resume_at = max(self.resume_at, time.monotonic() + delay)
+            else:
+                self.successes += 1
+                if self.successes >= self.size and self.size < self.limit:
+                    self.size += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+def embed_batched(texts: list, embedder: Embedder = None, max_in_flight: int = 8,
+                  max_retries: int = 6, progress=None):
+    """Embed ``texts`` in packed multi-input requests, several in flight at once.
+
+    Returns ``(matrix, ok)``: a contiguous (n, dim) float32 matrix in input
+    order, written in place as batches land, and a mask that is False where a
+    request still failed after ``max_retries``. Rate-limit errors shrink the
+    in-flight window and back off (honouring Retry-After); other errors are
+    retried with exponential backoff. ``progress(n)`` is called as batches land.
+    """
+    embedder = embedder or get_embedder()
+    texts = list(texts)
+    batches = pack_batches(texts, embedder.max_batch_inputs, embedder.max_batch_tokens)
+    matrix, ok = None, np.zeros(len(texts), dtype=bool)
+    window = _AdaptiveWindow(max_in_flight)
+
+    def run(start, end):
+        for attempt in range(max_retries + 1):
+            window.acquire()
+            try:
+                vectors = embedder.embed(texts[start:end])
+            except Exception as e:
+                delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                limited = _is_rate_limit(e)
+                window.release(limited, _retry_after(e) or delay)
+                if attempt == max_retries:
+                    print(f"❌ Embedding error for {end - start} chunks at #{start}: {e}")
+                    return start, end, None
+                if not limited:
+                    time.sleep(delay)
+                continue
+            window.release()
+            return start, end, vectors
+        return start, end, None
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        futures = [pool.submit(run, start, end) for start, end in batches]
+        for future in as_completed(futures):
+            start, end, vectors = future.result()
+            if vectors is not None:
+                if matrix is None:
+                    matrix = np.zeros((len(texts), np.shape(vectors)[1]), dtype=np.float32)
+                matrix[start:end] = vectors
+                ok[start:end] = True
+            if progress:
+                progress(end - start)
+    return (np.zeros((len(texts), 0), dtype=np.float32) if matrix is None else matrix), ok
+
+def load_faiss() -> "faiss.Index":
+    from utils.retrieval import get_index
+    return get_index()
 
-@lru_cache
 def load_metadata() -> pd.DataFrame:
-    return pd.read_pickle(METADATA_PATH)
+    from utils.retrieval import get_metadata
+    return get_metadata().to_pandas()
@@ -1,8 +1,14 @@
 import os
+import json
+import time
 import pandas as pd
 import numpy as np
 import faiss
-import pickle
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.metadata_store import MetadataStore
+from utils import embedding_shards, segments
 
 # === Paths ===
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -10,7 +16,41 @@ DATA_PATH = os.path.join(ROOT, "data", "docs_df_with_embeddings.parquet")
 VECTOR_STORE_DIR = os.path.join(ROOT, "vector_store")
 INDEX_PATH = os.path.join(VECTOR_STORE_DIR, "index.faiss")
 MATRIX_PATH = os.path.join(VECTOR_STORE_DIR, "embeddings_matrix.npy")
-METADATA_PATH = os.path.join(VECTOR_STORE_DIR, "docs_metadata.pkl")
+METADATA_PATH = os.path.join(VECTOR_STORE_DIR, "docs_metadata.arrow")
+LEGACY_METADATA_PATH = os.path.join(VECTOR_STORE_DIR, "docs_metadata.pkl")
+METADATA_COLUMNS = ["strain_id", "strain_name", "chunk", "effects", "dominant_terpene"]
+# Structured attributes used by filtered search (joined from cleaned_strains if absent)
+FILTER_COLUMNS = ["type", "thc", "cbd"]
+CLEANED_PATH = os.path.join(ROOT, "data", "cleaned_strains.parquet")
+INDEX_CONFIG_PATH = os.path.join(VECTOR_STORE_DIR, "index_config.json")
+TERM_INDICATORS_PATH = os.path.join(VECTOR_STORE_DIR, "term_indicators.npy")
+BM25_PATH = os.path.join(VECTOR_STORE_DIR, "bm25.npz")
+# Strain-level coarse index: unit-norm mean chunk vector per strain_id
+STRAIN_CENTROIDS_PATH = os.path.join(VECTOR_STORE_DIR, "strain_centroids.npy")
+STRAIN_CENTROID_IDS_PATH = os.path.join(VECTOR_STORE_DIR, "strain_centroid_ids.npy")
+
+# === Index Types ===
+INDEX_TYPES = ("flat", "ivf", "hnsw", "sq8", "fp16", "pq")
+DEFAULT_INDEX_PARAMS = {
+    "flat": {},
+    "ivf": {"nlist": None, "nprobe": 16},
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    # Compressed codes: candidates are re-ranked exactly against embeddings_matrix.npy
+    "sq8": {"rerank_factor": 4},
+    "fp16": {"rerank_factor": 2},
+    "pq": {"m": 48, "nbits": 8, "rerank_factor": 8},
+}
+# Search-time knobs that must be re-applied whenever the index is loaded
+SEARCH_PARAMS = ("nprobe", "efSearch")
+# "ip" stores unit-normalised vectors in an inner-product index, so scores are cosine similarities
+METRICS = ("l2", "ip")
+
+# Incremental updates: compact once this share of ids is dead or segments pile up
+COMPACT_DEAD_RATIO = 0.2
+COMPACT_MAX_SEGMENTS = 8
+# Index types whose search scores are exact, so ids can be checked against the matrix
+EXACT_CODE_TYPES = ("flat", "ivf", "hnsw")
+ID_CHECK_SAMPLE = 64
 
 def generate_leafly_url(name: str) -> str:
     if isinstance(name, str) and name.strip():
@@ -18,6 +58,281 @@ def generate_leafly_url(name: str) -> str:
         return f"https://www.leafly.com/strains/{slug}"
     return "https://www.leafly.com/strains"
 
+def resolve_index_params(index_type: str, n_vectors: int, **overrides) -> dict:
+    """Merge defaults with overrides; IVF picks nlist ≈ 4·sqrt(N) when unset."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+    params = dict(DEFAULT_INDEX_PARAMS[index_type])
+    params.update({k: v for k, v in overrides.items() if v is not None and k in params})
+    if index_type == "ivf":
+        if not params["nlist"]:
+            params["nlist"] = int(4 * np.sqrt(n_vectors))
+        # FAISS needs ~39 training points per list
+        params["nlist"] = max(1, min(params["nlist"], n_vectors // 39))
+        params["nprobe"] = min(params["nprobe"], params["nlist"])
+    return params
+
+def normalize_rows(matrix: np.ndarray, copy: bool = True) -> np.ndarray:
+    """Contiguous float32 ``matrix`` with unit-norm rows (zero rows stay zero).
+
+    With ``copy=False`` a contiguous float32 input is normalised in place.
+    """
+    matrix = np.array(matrix, dtype="float32", order="C", copy=True if copy else None, ndmin=2)
+    faiss.normalize_L2(matrix)
+    return matrix
+
+def prepare_vectors(matrix: np.ndarray, metric: str = "l2", copy: bool = True) -> np.ndarray:
+    """Vectors as stored for ``metric``: normalised once at build time for "ip".
+
+    Builders pass ``copy=False`` for matrices they own, so peak memory stays
+    at one matrix.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric} (expected one of {METRICS})")
+    if metric == "ip":
+        return normalize_rows(matrix, copy)
+    return np.ascontiguousarray(matrix, dtype="float32")
+
+def index_metric(index: faiss.Index) -> str:
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+def build_index(matrix: np.ndarray, index_type: str = "flat", train_sample=None, ids=None,
+                metric: str = "l2", add: bool = True, **params) -> faiss.Index:
+    """Build an ID-mapped FAISS index of the requested type over ``matrix``.
+
+    Row i gets id ``ids[i]`` (default i) so incremental updates can add and
+    remove vectors by id later on. IVF lists store ids themselves; every
+    other type is wrapped in an IDMap. With ``add=False`` the index is only
+    trained and the caller adds rows. For ``metric="ip"`` the rows must
+    already be unit-normalised (see ``prepare_vectors``).
+    """
+    dim = matrix.shape[1]
+    params = resolve_index_params(index_type, len(matrix), **params)
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, faiss_metric)
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlat(dim, faiss_metric)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss_metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["M"], faiss_metric)
+        index.hnsw.efConstruction = params["efConstruction"]
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss_metric)
+    elif index_type == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss_metric)
+    else:
+        if dim % params["m"]:
+            raise ValueError(f"PQ sub-quantizers m={params['m']} must divide dim={dim}")
+        index = faiss.IndexPQ(dim, params["m"], params["nbits"], faiss_metric)
+
+    if not index.is_trained:
+        index.train(matrix if train_sample is None else train_sample)
+    if index_type != "ivf":
+        index = faiss.IndexIDMap2(index)
+    if add:
+        index.add_with_ids(matrix, np.arange(len(matrix), dtype=np.int64) if ids is None else ids)
+    apply_search_params(index, params)
+    return index
+
+def apply_search_params(index: faiss.Index, params: dict) -> faiss.Index:
+    """Set nprobe / efSearch on a (possibly wrapped) index."""
+    space = faiss.ParameterSpace()
+    for name in SEARCH_PARAMS:
+        if params.get(name) is not None:
+            try:
+                space.set_index_parameter(index, name, params[name])
+            except RuntimeError:
+                pass  # parameter does not apply to this index type
+    return index
+
+def rerank_exact(matrix: np.ndarray, query: np.ndarray, ids: np.ndarray, k: int, metric: str = "l2"):
+    """Re-score candidate ``ids`` exactly against rows read from ``matrix``.
+
+    Returns squared L2 distances (ascending) or inner products (descending)
+    depending on ``metric``. ``matrix`` may be a read-only memmap; only the
+    candidate rows are touched.
+    """
+    ids = ids[ids >= 0]
+    order = np.argsort(ids)  # sorted reads are friendlier to the page cache
+    rows = np.asarray(matrix[ids[order]], dtype="float32")
+    scores = np.empty(len(ids), dtype="float32")
+    if metric == "ip":
+        scores[order] = rows @ query.reshape(-1)
+        top = np.argsort(-scores, kind="stable")[:k]
+    else:
+        scores[order] = ((rows - query.reshape(1, -1)) ** 2).sum(axis=1)
+        top = np.argsort(scores, kind="stable")[:k]
+    return scores[top], ids[top]
+
+def search_index(index: faiss.Index, query: np.ndarray, k: int, matrix=None, rerank_factor=None,
+                 params=None):
+    """Search one query; over-fetch and re-rank exactly when a matrix is given.
+
+    ``params`` is an optional ``faiss.SearchParameters`` (e.g. an ID selector).
+    The query is expected in the same space as the index (normalised for "ip").
+    """
+    query = np.asarray(query, dtype="float32").reshape(1, -1)
+    if matrix is None or not rerank_factor:
+        D, I = index.search(query, k, params=params)
+        valid = I[0] >= 0
+        return D[0][valid], I[0][valid]
+    _, I = index.search(query, k * rerank_factor, params=params)
+    return rerank_exact(matrix, query, I[0], k, index_metric(index))
+
+def selector_params(mask: np.ndarray, index_type: str, params: dict):
+    """SearchParameters restricting the search to ids where ``mask`` is True."""
+    bitmap = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    selector.bitmap_buffer = bitmap  # keep the buffer alive as long as the selector
+    if index_type == "ivf":
+        search_params = faiss.SearchParametersIVF(sel=selector, nprobe=params.get("nprobe", 1))
+    elif index_type == "hnsw":
+        search_params = faiss.SearchParametersHNSW(sel=selector, efSearch=params.get("efSearch", 16))
+    else:
+        search_params = faiss.SearchParameters(sel=selector)
+    search_params.selector_ref = selector
+    return search_params
+
+def removes_in_place(index: faiss.Index) -> bool:
+    """Whether ``remove_ids`` keeps the remaining ids pointing at their vectors.
+
+    An IDMap compacts its id table on removal, which only matches the inner
+    index when that index compacts too; IVF lists keep their old offsets.
+    Stores built before IVF was left unwrapped still have such a wrapper.
+    """
+    return not (isinstance(index, faiss.IndexIDMap)
+                and isinstance(faiss.downcast_index(index.index), faiss.IndexIVF))
+
+def check_index_ids(index: faiss.Index, matrix, ids: np.ndarray, metric: str = "l2", tol: float = 1e-3):
+    """Raise if searching stored rows ``ids`` returns hits that score differently exactly.
+
+    Each row of ``matrix`` (rows are addressed by id) is searched for its
+    nearest neighbour, which must score the same against the row the hit's id
+    points at. Only valid for indexes that keep full vectors (flat, ivf, hnsw).
+    """
+    ids = np.sort(np.asarray(ids, dtype=np.int64))
+    if not len(ids):
+        return
+    queries = np.asarray(matrix[ids], dtype="float32")
+    D, I = index.search(queries, 1)
+    hits = I[:, 0]
+    if (hits < 0).any():
+        raise RuntimeError(f"Index lost stored ids, e.g. {ids[hits < 0][:5].tolist()}")
+    rows = np.asarray(matrix[hits], dtype="float32")
+    if metric == "ip":
+        exact = (rows * queries).sum(axis=1)
+    else:
+        exact = ((rows - queries) ** 2).sum(axis=1)
+    bad = np.abs(exact - D[:, 0]) > tol * np.maximum(1.0, np.abs(exact))
+    if bad.any():
+        raise RuntimeError(f"Index ids no longer match their vectors: stored row {int(ids[bad][0])} "
+                           f"found id {int(hits[bad][0])} at score {float(D[bad, 0][0]):.4f}, "
+                           f"exact {float(exact[bad][0]):.4f}")
+
+def load_index_config() -> dict:
+    if not os.path.exists(INDEX_CONFIG_PATH):
+        return {"index_type": "flat", "params": {}}
+    with open(INDEX_CONFIG_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_index_config(index_type: str, params: dict, index: faiss.Index, report=None,
+                      embedding_model=None):
+    config = {
+        "index_type": index_type,
+        "metric": index_metric(index),
+        "dim": index.d,
+        "ntotal": int(index.ntotal),
+        "params": params,
+    }
+    if embedding_model:
+        # Queries must be embedded by the same backend that produced the stored vectors
+        config["embedding_model"] = embedding_model
+    if report:
+        config["report"] = report
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    with open(INDEX_CONFIG_PATH, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+def evaluate_index(index: faiss.Index, matrix: np.ndarray, queries: np.ndarray, k: int = 10,
+                   rerank_factor=None, exclude=None) -> dict:
+    """Recall@k against exact search plus single-query latency percentiles.
+
+    ``exclude`` lists rows of ``matrix`` that are not in ``index`` (e.g. the
+    held-out queries themselves); they are left out of the exact neighbours.
+    """
+    exclude = np.empty(0, dtype=np.int64) if exclude is None else np.asarray(exclude, dtype=np.int64)
+    # Brute force straight over ``matrix``; a flat index would hold a second copy
+    _, truth = faiss.knn(np.ascontiguousarray(queries, dtype="float32"), matrix,
+                         min(k + len(exclude), len(matrix)), metric=index.metric_type)
+    if len(exclude):
+        truth = np.stack([row[~np.isin(row, exclude)][:k] for row in truth])
+
+    found = np.empty_like(truth)
+    timings = np.empty(len(queries))
+    for i, q in enumerate(queries):
+        t0 = time.perf_counter()
+        _, I = search_index(index, q, k, matrix, rerank_factor)
+        timings[i] = time.perf_counter() - t0
+        found[i] = -1
+        found[i, :len(I)] = I
+
+    hits = sum(len(np.intersect1d(t, f)) for t, f in zip(truth, found))
+    return {
+        "k": k,
+        "n_queries": len(queries),
+        f"recall@{k}": round(hits / truth.size, 4),
+        "p50_ms": round(float(np.percentile(timings, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(timings, 99)) * 1000, 3),
+    }
+
+def save_term_indicators(contents, path: str = TERM_INDICATORS_PATH) -> np.ndarray:
+    """Precompute per-chunk effect/aroma indicators for the re-ranker."""
+    from utils.reranker import build_term_indicators
+    indicators = build_term_indicators(contents)
+    _replace_file(path, lambda tmp: np.save(tmp, indicators))
+    return indicators
+
+def compute_strain_centroids(matrix, strain_ids: np.ndarray, row_ids=None, block: int = 65536):
+    """Unit-norm mean vector per strain over rows ``row_ids`` of ``matrix`` (default all).
+
+    ``matrix`` may be a memmap or SegmentedArray; rows are read in strain
+    order, ``block`` at a time. Returns ``(strain ids, centroids)``.
+    """
+    row_ids = np.arange(len(strain_ids), dtype=np.int64) if row_ids is None else np.asarray(row_ids, dtype=np.int64)
+    owners = np.asarray(strain_ids)[row_ids]
+    order = np.argsort(owners, kind="stable")
+    row_ids, owners = row_ids[order], owners[order]
+    unique, group = np.unique(owners, return_inverse=True)
+    sums = np.zeros((len(unique), matrix.shape[1]), dtype="float32")
+    for lo in range(0, len(row_ids), block):
+        g = group[lo:lo + block]
+        starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        rows = np.asarray(matrix[row_ids[lo:lo + block]], dtype="float32")
+        # Groups are contiguous, so each block touches every strain at most once
+        sums[g[starts]] += np.add.reduceat(rows, starts, axis=0)
+    return unique.astype(np.int64), normalize_rows(sums)
+
+def save_strain_centroids(matrix, strain_ids: np.ndarray, row_ids=None):
+    """Write the strain centroid index used by two-stage retrieval."""
+    ids, centroids = compute_strain_centroids(matrix, strain_ids, row_ids)
+    _replace_file(STRAIN_CENTROIDS_PATH, lambda tmp: np.save(tmp, centroids))
+    _replace_file(STRAIN_CENTROID_IDS_PATH, lambda tmp: np.save(tmp, ids))
+    return ids, centroids
+
+def lexical_texts(meta_df: pd.DataFrame) -> list:
+    """Text indexed by BM25: strain name + chunk, so named-strain queries match."""
+    return (meta_df["strain_name"].fillna("").astype(str) + " " + meta_df["content"].fillna("").astype(str)).tolist()
+
+def save_lexical_index(meta_df: pd.DataFrame):
+    """Build the BM25 inverted index over every row of ``meta_df`` (row i ↔ FAISS id i)."""
+    from utils.lexical import BM25Index
+    lexical = BM25Index.build(lexical_texts(meta_df))
+    _replace_file(BM25_PATH, lexical.save)
+    return lexical
+
 def load_faiss_index_safe():
     """Load or rebuild the FAISS index if it fails validation."""
     try:
@@ -27,43 +342,293 @@ def load_faiss_index_safe():
         print("⚠️ FAISS index is missing or corrupted. Rebuilding…")
         return rebuild_faiss_index()
 
-def rebuild_faiss_index():
-    """Rebuild index.faiss, embeddings_matrix.npy, and docs_metadata.pkl"""
-    if not os.path.exists(DATA_PATH):
-        raise FileNotFoundError("Missing: docs_df_with_embeddings.parquet")
+def strain_keys(names, positions) -> np.ndarray:
+    """Stable int64 id per row: a hash of the normalised strain name.
+
+    ``positions`` (catalogue row of each strain) only tell apart strains that
+    share a name, so the n-th "Blue Dream" keeps its id when other strains are
+    added, removed or reordered.
+    """
+    names = pd.Series(np.asarray(names, dtype=object)).fillna("").astype(str)
+    frame = pd.DataFrame({"name": names.str.lower().str.split().str.join(" "),
+                          "position": np.asarray(positions, dtype=np.int64)})
+    strains = frame.drop_duplicates("position").sort_values("position", kind="stable")
+    strains["n"] = strains.groupby("name").cumcount()
+    keys = pd.util.hash_pandas_object(strains[["name", "n"]], index=False).to_numpy().view(np.int64)
+    return pd.Series(keys, index=strains["position"].to_numpy()).reindex(frame["position"]).to_numpy()
 
-    df = pd.read_parquet(DATA_PATH)
+def chunk_keys(strain_ids, chunk_indexes) -> np.ndarray:
+    """Stable int64 key per (strain key, chunk_index)."""
+    frame = pd.DataFrame({"strain": np.asarray(strain_ids, dtype=np.int64),
+                          "chunk": np.asarray(chunk_indexes, dtype=np.int64)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
 
-    if "embedding" not in df.columns:
+def assign_keys(meta_df: pd.DataFrame) -> pd.DataFrame:
+    """Replace positional ``strain_id`` (catalogue row) with the stable strain key and set ``chunk_key``."""
+    meta_df["strain_id"] = strain_keys(meta_df["strain_name"], meta_df["strain_id"])
+    meta_df["chunk_key"] = chunk_keys(meta_df["strain_id"], meta_df["chunk_index"])
+    return meta_df
+
+def build_metadata(df: pd.DataFrame) -> pd.DataFrame:
+    """Metadata rows in the same order as the embedding matrix (row i ↔ FAISS id i).
+
+    ``strain_id`` in the result is the stable strain key (see ``strain_keys``),
+    not the catalogue row the chunk came from.
+    """
+    meta_df = df[METADATA_COLUMNS + [c for c in FILTER_COLUMNS if c in df.columns]].reset_index(drop=True)
+    # Keys and content hashes let incremental updates diff against the store
+    chunk_index = df["chunk_index"].to_numpy() if "chunk_index" in df.columns \
+        else meta_df.groupby("strain_id").cumcount().to_numpy()
+    meta_df["chunk_index"] = chunk_index.astype(np.int64)
+    meta_df = assign_keys(meta_df)
+    meta_df["content_hash"] = pd.util.hash_pandas_object(meta_df["chunk"], index=False).to_numpy()
+
+    missing = [c for c in FILTER_COLUMNS if c not in meta_df.columns]
+    if missing and os.path.exists(CLEANED_PATH):
+        # Joined by strain key, so rows added or removed in the catalogue don't shift attributes
+        strains = pd.read_parquet(CLEANED_PATH, columns=["strain_name"] + missing)
+        strains.index = strain_keys(strains["strain_name"], np.arange(len(strains)))
+        for c in missing:
+            meta_df[c] = strains[c].reindex(meta_df["strain_id"].to_numpy()).to_numpy()
+    for c in ("thc", "cbd"):
+        if c in meta_df.columns:
+            meta_df[c] = pd.to_numeric(meta_df[c], errors="coerce").astype("float32")
+    meta_df["leafly_url"] = meta_df["strain_name"].apply(generate_leafly_url)
+    return meta_df.rename(columns={"chunk": "content"})
+
+def diff_chunks(old_keys: np.ndarray, old_hashes: np.ndarray, new_meta: pd.DataFrame):
+    """``(pos, added, changed, removed)`` of ``new_meta`` against live store rows.
+
+    ``pos`` maps each new row to its old row (-1 if new); ``added`` / ``changed``
+    are masks over ``new_meta``, ``removed`` over the old rows.
+    """
+    old_keys = pd.Index(old_keys)
+    new_keys = new_meta["chunk_key"].to_numpy()
+    pos = old_keys.get_indexer(new_keys)
+    added = pos < 0
+    changed = ~added
+    changed[changed] = np.asarray(old_hashes)[pos[changed]] != new_meta["content_hash"].to_numpy()[changed]
+    removed = ~old_keys.isin(new_keys)
+    return pos, added, changed, removed
+
+def load_metadata_store() -> MetadataStore:
+    """Open the metadata segments, converting a legacy docs_metadata.pkl on first use."""
+    if not os.path.exists(METADATA_PATH) and os.path.exists(LEGACY_METADATA_PATH):
+        legacy = pd.read_pickle(LEGACY_METADATA_PATH)
+        legacy = pd.DataFrame(legacy) if isinstance(legacy, list) else legacy
+        try:
+            MetadataStore.write(legacy, METADATA_PATH)
+        except OSError:
+            return MetadataStore.from_pandas(legacy)  # read-only deployment
+    if not os.path.exists(segments.MANIFEST_PATH):
+        return MetadataStore.open(METADATA_PATH)
+    return segments.open_metadata(segments.load_manifest())
+
+def _replace_file(path: str, writer):
+    """Write via a temp file + rename so live memory maps keep the old inode."""
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    writer(tmp)
+    os.replace(tmp, path)
+
+def load_embedding_frame(path: str = DATA_PATH):
+    """``(chunks, matrix)`` from a legacy docs_df_with_embeddings.parquet.
+
+    The list column is flattened by Arrow into one contiguous matrix rather
+    than stacked from per-row Python lists.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Missing: {path}")
+
+    table = pq.read_table(path)
+
+    if "embedding" not in table.column_names:
         raise ValueError("Missing 'embedding' column in input data")
 
-    df = df.dropna(subset=["embedding"])
-    if df.empty:
+    missing = [c for c in METADATA_COLUMNS if c not in table.column_names]
+    if missing:
+        raise ValueError(f"Missing metadata columns: {missing}")
+
+    # Drop incomplete rows up front so vectors and metadata stay aligned
+    table = table.filter(pc.and_(pc.is_valid(table.column("embedding")), pc.is_valid(table.column("chunk"))))
+    if not len(table):
         raise ValueError("No valid embeddings to build FAISS index")
+    matrix = embedding_shards.arrow_to_matrix(table.column("embedding"))
+    return table.drop_columns(["embedding"]).to_pandas(), matrix
 
-    # Build FAISS index
-    embedding_dim = len(df["embedding"].iloc[0])
-    embedding_matrix = np.vstack(df["embedding"].tolist()).astype("float32")
-    index = faiss.IndexFlatL2(embedding_dim)
-    index.add(embedding_matrix)
+def load_embeddings(path: str = DATA_PATH):
+    """``(chunks, matrix)`` from the embedding shards, or the legacy single parquet.
 
-    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-    np.save(MATRIX_PATH, embedding_matrix)
+    ``chunks`` holds the metadata columns (no vectors); row i of the float32
+    ``matrix`` is chunk i.
+    """
+    if not embedding_shards.load_manifest()["shards"]:
+        return load_embedding_frame(path)
 
-    # Save metadata
-    required = ["strain_id", "strain_name", "chunk", "effects", "dominant_terpene"]
-    missing = [c for c in required if c not in df.columns]
+    df, matrix = embedding_shards.load_shards()
+    missing = [c for c in METADATA_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing metadata columns: {missing}")
+    keep = df["chunk"].notna().to_numpy()
+    if not keep.all():
+        df, matrix = df[keep].reset_index(drop=True), matrix[keep]
+    if df.empty:
+        raise ValueError("No valid embeddings to build FAISS index")
+    return df, matrix
 
-    meta_df = df[required].copy()
-    meta_df["leafly_url"] = meta_df["strain_name"].apply(generate_leafly_url)
-    meta_df.rename(columns={"chunk": "content"}, inplace=True)
-    meta_df.dropna(subset=["content"], inplace=True)
-    metadata = meta_df.to_dict(orient="records")
-    with open(METADATA_PATH, "wb") as f:
-        pickle.dump(metadata, f)
+def embedding_model_of(df: pd.DataFrame):
+    """Embedding backend recorded by embed_strain_descriptions.py (None for older files)."""
+    if "embedding_model" not in df.columns:
+        return None
+    models = df["embedding_model"].dropna().unique()
+    if len(models) > 1:
+        raise ValueError(f"Mixed embedding models in input data: {sorted(models)} — re-embed with one backend")
+    return str(models[0]) if len(models) else None
+
+def write_vector_store(index: faiss.Index, matrix: np.ndarray, meta_df: pd.DataFrame,
+                       index_type: str, params: dict, report=None, embedding_model=None):
+    """Write a full build as a single base segment and drop any tombstones."""
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    _replace_file(INDEX_PATH, lambda tmp: faiss.write_index(index, tmp))
+    _replace_file(MATRIX_PATH, lambda tmp: np.save(tmp, matrix))
+    _replace_file(METADATA_PATH, lambda tmp: MetadataStore.write(meta_df, tmp))
+    indicators = save_term_indicators(meta_df["content"])
+    save_lexical_index(meta_df)
+    save_strain_centroids(matrix, meta_df["strain_id"].to_numpy())
+    save_index_config(index_type, params, index, report, embedding_model)
+    segments.clear_tombstones()
+    segments.save_manifest(segments.base_manifest(len(matrix)))
+    return indicators
+
+def rebuild_faiss_index():
+    """Rebuild index.faiss, embeddings_matrix.npy, and docs_metadata.arrow
 
-    print(f"✅ Rebuilt FAISS index with {index.ntotal:,} vectors (dim={embedding_dim})")
+    Reuses the index type and parameters recorded in index_config.json.
+    """
+    df, embedding_matrix = load_embeddings()
+
+    # Build FAISS index
+    embedding_dim = embedding_matrix.shape[1]
+    config = load_index_config()
+    metric = config.get("metric", "l2")
+    embedding_matrix = prepare_vectors(embedding_matrix, metric, copy=False)
+    params = resolve_index_params(config["index_type"], len(embedding_matrix), **config.get("params", {}))
+    index = build_index(embedding_matrix, config["index_type"], metric=metric, **params)
+
+    # Save index, matrix and metadata
+    write_vector_store(index, embedding_matrix, build_metadata(df), config["index_type"], params,
+                       embedding_model=embedding_model_of(df) or config.get("embedding_model"))
+
+    print(f"✅ Rebuilt {config['index_type']} FAISS index with {index.ntotal:,} vectors (dim={embedding_dim})")
     return index
+
+# === Incremental Updates ===
+def update_vector_store(df: pd.DataFrame, embeddings: np.ndarray, compact: bool = None) -> dict:
+    """Apply a new catalogue snapshot to the store without a full rebuild.
+
+    Chunks are matched by (strain key, chunk_index): new keys are appended as
+    a new segment, keys that disappeared are deleted, and keys whose text
+    changed are replaced. Only the affected rows of ``embeddings`` (aligned
+    with ``df``) are added.
+    """
+    manifest = segments.load_manifest()
+    if not os.path.exists(segments.MANIFEST_PATH):
+        raise FileNotFoundError("No segments.json — run a full build before incremental updates.")
+    config = load_index_config()
+    model = embedding_model_of(df)
+    if model and config.get("embedding_model") and model != config["embedding_model"]:
+        raise ValueError(f"Embeddings are from {model} but the store was built with "
+                         f"{config['embedding_model']} — run a full build instead.")
+    store = segments.open_metadata(manifest)
+    if "chunk_key" not in store.columns:
+        raise ValueError("Vector store predates incremental updates — run a full build first.")
+    if manifest.get("key_scheme") != segments.KEY_SCHEME:
+        raise ValueError("Vector store keys chunks by catalogue row — run a full build (or --compact) first.")
+
+    dead = segments.load_tombstones()
+    live = np.ones(len(store), dtype=bool)
+    live[dead] = False
+    live_ids = np.flatnonzero(live)
+    new_meta = build_metadata(df)
+    pos, added, changed, removed = diff_chunks(store.column("chunk_key")[live_ids],
+                                               store.column("content_hash")[live_ids], new_meta)
+
+    drop_ids = np.concatenate([live_ids[removed], live_ids[pos[changed]]]).astype(np.int64)
+    add_rows = np.flatnonzero(added | changed)
+    stats = {"added": int(added.sum()), "changed": int(changed.sum()), "removed": int(removed.sum())}
+    if not len(drop_ids) and not len(add_rows):
+        print("✅ Vector store already up to date.")
+        return stats
+
+    index = faiss.read_index(INDEX_PATH)
+    if len(drop_ids):
+        try:
+            if not removes_in_place(index):
+                raise RuntimeError("remove_ids would shift ids")
+            index.remove_ids(drop_ids)
+        except RuntimeError:
+            manifest["soft_deletes"] = True  # e.g. HNSW: hide via tombstones at query time
+    if len(add_rows):
+        matrix = prepare_vectors(embeddings[add_rows], index_metric(index), copy=False)
+        ids = manifest["next_id"] + np.arange(len(add_rows), dtype=np.int64)
+        files = segments.segment_files(len(manifest["segments"]))
+        np.save(segments.segment_path(files["matrix"]), matrix)
+        seg_meta = new_meta.iloc[add_rows]
+        MetadataStore.write(seg_meta, segments.segment_path(files["metadata"]))
+        save_term_indicators(seg_meta["content"], segments.segment_path(files["indicators"]))
+        index.add_with_ids(matrix, ids)
+        manifest["segments"].append(dict(files, start=int(manifest["next_id"]), rows=len(add_rows)))
+        manifest["next_id"] = int(manifest["next_id"] + len(add_rows))
+
+    if config["index_type"] in EXACT_CODE_TYPES:
+        # Spot-check surviving and new rows before the index replaces the old one
+        kept = np.setdiff1d(live_ids, drop_ids)
+        new_ids = np.arange(len(store), manifest["next_id"], dtype=np.int64)
+        rng = np.random.default_rng(0)
+        sample = np.concatenate([rng.choice(kept, min(len(kept), ID_CHECK_SAMPLE), replace=False),
+                                 rng.choice(new_ids, min(len(new_ids), ID_CHECK_SAMPLE), replace=False)])
+        check_index_ids(index, segments.SegmentedArray.open(manifest, "matrix"), sample, index_metric(index))
+
+    _replace_file(INDEX_PATH, lambda tmp: faiss.write_index(index, tmp))
+    save_index_config(config["index_type"], config.get("params", {}), index, config.get("report"),
+                      config.get("embedding_model") or model)
+    segments.save_tombstones(np.concatenate([dead, drop_ids]))
+    # BM25 statistics are corpus-wide, so the small lexical index is rebuilt over all rows
+    all_meta = segments.open_metadata(manifest)
+    save_lexical_index(all_meta.to_pandas(["strain_name", "content"]))
+    live = np.ones(manifest["next_id"], dtype=bool)
+    live[np.concatenate([dead, drop_ids]).astype(np.int64)] = False
+    save_strain_centroids(segments.SegmentedArray.open(manifest, "matrix"), all_meta.column("strain_id"),
+                          np.flatnonzero(live))
+    segments.save_manifest(manifest)
+    print(f"✅ Incremental update: +{stats['added']} new, ~{stats['changed']} changed, -{stats['removed']} removed")
+
+    dead_ratio = (len(dead) + len(drop_ids)) / max(manifest["next_id"], 1)
+    if compact or (compact is None and (dead_ratio > COMPACT_DEAD_RATIO
+                                        or len(manifest["segments"]) > COMPACT_MAX_SEGMENTS)):
+        compact_vector_store()
+    return stats
+
+def compact_vector_store():
+    """Merge all segments into a fresh base segment holding live rows only."""
+    manifest = segments.load_manifest()
+    store = segments.open_metadata(manifest)
+    live = np.ones(len(store), dtype=bool)
+    live[segments.load_tombstones()] = False
+    live_ids = np.flatnonzero(live)
+
+    matrix = np.ascontiguousarray(segments.SegmentedArray.open(manifest, "matrix")[live_ids], dtype="float32")
+    meta_df = store.take(live_ids)
+    if manifest.get("key_scheme") != segments.KEY_SCHEME:
+        meta_df = assign_keys(meta_df)  # store written before stable strain keys
+    config = load_index_config()
+    params = resolve_index_params(config["index_type"], len(matrix), **config.get("params", {}))
+    index = build_index(matrix, config["index_type"], metric=config.get("metric", "l2"), **params)
+    old_files = [s[key] for s in manifest["segments"][1:] for key in segments.BASE_SEGMENT]
+
+    write_vector_store(index, matrix, meta_df, config["index_type"], params, config.get("report"),
+                       config.get("embedding_model"))
+    for name in old_files:
+        if os.path.exists(segments.segment_path(name)):
+            os.remove(segments.segment_path(name))
+    print(f"🧹 Compacted {len(manifest['segments'])} segments → {index.ntotal:,} live vectors")
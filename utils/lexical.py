@@ -0,0 +1,109 @@
+# === utils/lexical.py ===
+"""
+Local BM25 inverted index over chunk text (plus strain name).
+
+Built at index time next to index.faiss so that queries naming a strain or
+terpene can be matched exactly, and fused with vector hits via reciprocal
+rank fusion. Postings are stored CSR-style (term → slice of doc ids and
+precomputed BM25 weights), so scoring a query is a handful of NumPy slices
+and one ``bincount``.
+"""
+
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its me my of on or "
+    "that the this to was what when which with would you your".split()
+)
+
+
+def tokenize(text) -> list:
+    if not isinstance(text, str):
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocab, term_ptr, doc_ids, weights, n_docs):
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.terms = np.asarray(vocab)
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def build(cls, texts, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Index ``texts`` (row i ↔ FAISS id i)."""
+        vocab, rows, cols, tfs = {}, [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[doc] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc)
+                tfs.append(tf)
+
+        term_of = np.asarray(rows, dtype=np.int64)
+        docs = np.asarray(cols, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float32)
+
+        df = np.bincount(term_of, minlength=len(vocab)).astype(np.float32)
+        idf = np.log1p((len(texts) - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths[docs] / max(lengths.mean(), 1.0))
+        weights = idf[term_of] * tf * (k1 + 1) / (tf + norm)
+
+        order = np.argsort(term_of, kind="stable")
+        term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_ptr[1:] = np.cumsum(np.bincount(term_of, minlength=len(vocab)))
+        terms = np.empty(len(vocab), dtype=object)
+        for term, i in vocab.items():
+            terms[i] = term
+        return cls(terms.astype(str), term_ptr, docs[order], weights[order].astype(np.float32), len(texts))
+
+    def save(self, path: str):
+        np.savez(path, vocab=self.terms, term_ptr=self.term_ptr, doc_ids=self.doc_ids,
+                 weights=self.weights, n_docs=np.int64(self.n_docs))
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        data = np.load(path)
+        return cls(data["vocab"], data["term_ptr"], data["doc_ids"], data["weights"], data["n_docs"])
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score for every document (zeros where no query term occurs)."""
+        slices = [slice(self.term_ptr[t], self.term_ptr[t + 1])
+                  for t in (self.vocab.get(tok) for tok in set(tokenize(query))) if t is not None]
+        if not slices:
+            return np.zeros(self.n_docs, dtype=np.float32)
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        return np.bincount(docs, weights=weights, minlength=self.n_docs).astype(np.float32)
+
+    def search(self, query: str, n: int, mask=None):
+        """Top ``n`` (scores, ids) with a positive score, optionally restricted by ``mask``."""
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask[:self.n_docs]] = 0.0
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > n:
+            hits = hits[np.argpartition(-scores[hits], n - 1)[:n]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return scores[hits], hits.astype(np.int64)
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """Fuse ranked id lists; returns (ids, fused scores) best first."""
+    ids = np.concatenate([np.asarray(r, dtype=np.int64) for r in rankings])
+    ranks = np.concatenate([np.arange(len(r)) for r in rankings])
+    if not len(ids):
+        return ids, np.array([], dtype=np.float32)
+    unique, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=1.0 / (k + 1 + ranks)).astype(np.float32)
+    order = np.argsort(-fused, kind="stable")
+    return unique[order], fused[order]
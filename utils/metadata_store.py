@@ -0,0 +1,64 @@
+# === utils/metadata_store.py ===
+"""
+Columnar chunk metadata aligned to FAISS ids (row i ↔ vector id i).
+
+Stored as an uncompressed Arrow IPC (Feather v2) file and memory-mapped on
+open, so workers share the OS page cache and only the rows/columns asked for
+through ``take`` are materialised as Python objects.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+class MetadataStore:
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self._columns = {}
+
+    @classmethod
+    def open(cls, path: str) -> "MetadataStore":
+        source = pa.memory_map(path, "r")
+        return cls(pa.ipc.open_file(source).read_all())
+
+    @classmethod
+    def from_pandas(cls, df: pd.DataFrame) -> "MetadataStore":
+        return cls(pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False))
+
+    @classmethod
+    def concat(cls, stores) -> "MetadataStore":
+        """Zero-copy view over several stores, in order (ids continue across them)."""
+        return cls(pa.concat_tables([s.table for s in stores], promote_options="default"))
+
+    @staticmethod
+    def write(df: pd.DataFrame, path: str):
+        """Write ``df`` (one row per FAISS id, in id order) as uncompressed Feather."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        feather.write_feather(table, path, compression="uncompressed")
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def columns(self) -> list:
+        return self.table.column_names
+
+    def column(self, name: str) -> np.ndarray:
+        """Whole column as NumPy (zero-copy for numeric columns), cached."""
+        if name not in self._columns:
+            self._columns[name] = self.table.column(name).to_numpy()
+        return self._columns[name]
+
+    def take(self, ids, columns=None) -> pd.DataFrame:
+        """Materialise only rows ``ids`` (in that order) and the given columns."""
+        table = self.table if columns is None else self.table.select(columns)
+        return table.take(pa.array(np.asarray(ids, dtype=np.int64))).to_pandas()
+
+    def to_pandas(self, columns=None) -> pd.DataFrame:
+        table = self.table if columns is None else self.table.select(columns)
+        return table.to_pandas()
@@ -0,0 +1,55 @@
+# === utils/query_filters.py ===
+"""
+Turn phrases like "a myrcene-dominant indica under 18% THC" into the
+structured filters accepted by ``utils.retrieval.search_strains``.
+"""
+
+import re
+
+STRAIN_TYPES = ("indica", "sativa", "hybrid")
+TERPENES = (
+    "myrcene", "limonene", "pinene", "linalool", "caryophyllene", "humulene",
+    "terpinolene", "ocimene", "eucalyptol", "nerolidol", "geraniol", "bisabolol",
+    "farnesene", "phytol", "sabinene", "valencene",
+)
+
+_NUMBER = r"(\d+(?:\.\d+)?)\s*%?"
+_BELOW = r"(?:under|below|less than|lower than|at most|<=?)"
+_ABOVE = r"(?:over|above|more than|higher than|at least|>=?)"
+_TERPENE_RE = re.compile(rf"\b({'|'.join(TERPENES)})[\s-]*(?:dominant|heavy|rich|forward)\b")
+
+
+def _cannabinoid_range(text: str, name: str):
+    low = high = None
+    for pattern in (rf"{_BELOW}\s*{_NUMBER}\s*{name}", rf"{name}\s*{_BELOW}\s*{_NUMBER}"):
+        match = re.search(pattern, text)
+        if match:
+            high = float(match.group(1))
+    for pattern in (rf"{_ABOVE}\s*{_NUMBER}\s*{name}", rf"{name}\s*{_ABOVE}\s*{_NUMBER}"):
+        match = re.search(pattern, text)
+        if match:
+            low = float(match.group(1))
+    return None if low is None and high is None else (low, high)
+
+
+def parse_filters(text: str) -> dict:
+    """Extract ``type``, ``dominant_terpene``, ``thc`` and ``cbd`` filters from text."""
+    if not isinstance(text, str):
+        return {}
+    text = text.lower()
+    filters = {}
+
+    # Only a single named type is a constraint; "indica vs sativa" is a comparison
+    types = [t for t in STRAIN_TYPES if re.search(rf"\b{t}s?\b", text)]
+    if len(types) == 1:
+        filters["type"] = types[0]
+
+    terpenes = sorted(set(_TERPENE_RE.findall(text)))
+    if terpenes:
+        filters["dominant_terpene"] = terpenes
+
+    for name in ("thc", "cbd"):
+        bounds = _cannabinoid_range(text, name)
+        if bounds:
+            filters[name] = bounds
+    return filters
@@ -0,0 +1,87 @@
+# === utils/reranker.py ===
+"""
+Personalisation re-ranker.
+
+Each chunk gets a 0/1 indicator per effect/aroma term, computed once at index
+build time (vector_store/term_indicators.npy). At query time the profile is
+turned into a weight vector over the same terms, so the preference boost for
+any number of candidates is a single matrix-vector product. The boost is added
+to the candidate's cosine similarity, so relevance still orders candidates the
+profile has no opinion on.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Survey options plus the effect / flavour words common in Leafly descriptions
+EFFECT_TERMS = [
+    "relaxed", "euphoric", "focused", "creative", "uplifted", "sleepy", "energetic",
+    "happy", "hungry", "giggly", "talkative", "tingly", "aroused", "calm",
+]
+AROMA_TERMS = [
+    "fruity", "earthy", "citrus", "sweet", "herbal", "spicy", "pine", "diesel",
+    "berry", "lemon", "grape", "skunk", "woody", "pepper", "lavender", "mint",
+    "vanilla", "tropical", "pungent", "sour",
+]
+TERM_VOCAB = EFFECT_TERMS + AROMA_TERMS
+
+EFFECT_WEIGHT = 0.5
+AROMA_WEIGHT = 0.3
+# A 0.1 gap in cosine similarity is worth about one matched aroma
+SIMILARITY_WEIGHT = 2.0
+
+
+def build_term_indicators(contents, vocab=TERM_VOCAB) -> np.ndarray:
+    """(n_chunks, n_terms) uint8 matrix: 1 where the term occurs in the chunk."""
+    lowered = pd.Series(contents, dtype="object").fillna("").astype(str).str.lower()
+    indicators = np.zeros((len(lowered), len(vocab)), dtype=np.uint8)
+    for j, term in enumerate(vocab):
+        indicators[:, j] = lowered.str.contains(term, regex=False).to_numpy()
+    return indicators
+
+
+def preference_weights(profile: dict, vocab=TERM_VOCAB):
+    """Profile → weight vector over ``vocab`` plus weights for out-of-vocab terms."""
+    position = {term: j for j, term in enumerate(vocab)}
+    weights = np.zeros(len(vocab), dtype=np.float32)
+    extra = {}
+    for terms, weight in ((profile.get("desired_effects", []), EFFECT_WEIGHT),
+                          (profile.get("preferred_aromas", []), AROMA_WEIGHT)):
+        for term in {str(t).lower() for t in terms}:
+            if term in position:
+                weights[position[term]] += weight
+            else:
+                extra[term] = extra.get(term, 0.0) + weight
+    return weights, extra
+
+
+def rerank(results: pd.DataFrame, profile: dict, indicators: np.ndarray,
+           vocab=TERM_VOCAB) -> pd.DataFrame:
+    """Add ``adjusted_score`` (similarity + preference + reinforcement) and sort by it.
+
+    ``results`` must carry a ``doc_id`` column indexing rows of ``indicators``.
+    Without a ``similarity`` column, or for hits that only matched lexically
+    (NaN similarity), the lowest similarity among the candidates is used.
+    """
+    weights, extra = preference_weights(profile, vocab)
+    doc_ids = results["doc_id"].to_numpy()
+    base = np.asarray(indicators[doc_ids], dtype=np.float32) @ weights
+
+    # Terms outside the prebuilt vocabulary are scanned on the candidates only
+    if extra:
+        lowered = results["content"].fillna("").str.lower()
+        for term, weight in extra.items():
+            base += lowered.str.contains(term, regex=False).to_numpy() * weight
+
+    reinforcement = pd.Series(profile.get("reinforcement", {}), dtype=float)
+    reinforce = results["strain_name"].map(reinforcement).fillna(0.0).to_numpy()
+
+    similarity = np.zeros(len(results), dtype=np.float32)
+    if "similarity" in results.columns:
+        similarity = results["similarity"].to_numpy(dtype=np.float32)
+        floor = np.nanmin(similarity) if np.isfinite(similarity).any() else 0.0
+        similarity = np.where(np.isfinite(similarity), similarity, floor)
+
+    results = results.copy()
+    results["adjusted_score"] = SIMILARITY_WEIGHT * similarity + base + reinforce
+    return results.sort_values("adjusted_score", ascending=False, kind="stable")
@@ -0,0 +1,469 @@
+# === utils/retrieval.py ===
+"""
+Process-wide retrieval resources.
+
+Streamlit re-executes every page on each widget interaction, but imported
+modules stay in ``sys.modules`` for the lifetime of the server process.
+Keeping the FAISS index and the chunk metadata here means they are read from
+disk once per process and shared by every session, instead of being reloaded
+(and copied) on every rerun.
+"""
+
+import os
+import threading
+
+import faiss
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from utils.faiss_utils import (
+    BM25_PATH, INDEX_PATH, MATRIX_PATH, STRAIN_CENTROID_IDS_PATH, STRAIN_CENTROIDS_PATH,
+    apply_search_params, compute_strain_centroids, lexical_texts, load_index_config,
+    load_metadata_store, normalize_rows, rebuild_faiss_index, rerank_exact, search_index,
+    selector_params,
+)
+from utils.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from utils import segments
+from utils.metadata_store import MetadataStore
+from utils.reranker import TERM_VOCAB, build_term_indicators
+
+_LOCK = threading.RLock()
+_RESOURCES = {}
+_MANIFEST_MTIME = [None]
+
+
+def _shared(name, loader):
+    """Return the resource ``name``, loading it on first use only."""
+    with _LOCK:
+        if name not in _RESOURCES:
+            _RESOURCES[name] = loader()
+        return _RESOURCES[name]
+
+
+def clear_resources():
+    """Drop cached resources so the next access reloads them from disk."""
+    with _LOCK:
+        _RESOURCES.clear()
+
+
+def refresh_if_updated():
+    """Reload everything once an incremental update has rewritten segments.json."""
+    try:
+        mtime = os.path.getmtime(segments.MANIFEST_PATH)
+    except OSError:
+        return
+    with _LOCK:
+        if _MANIFEST_MTIME[0] is not None and mtime != _MANIFEST_MTIME[0]:
+            _RESOURCES.clear()
+        _MANIFEST_MTIME[0] = mtime
+
+
+# === Loaders ===
+def _read_index_mmap(path: str) -> faiss.Index:
+    """Memory-map the index so workers share the OS page cache."""
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except Exception:
+        return faiss.read_index(path)
+
+
+def _load_index() -> faiss.Index:
+    try:
+        index = _read_index_mmap(INDEX_PATH)
+    except Exception:
+        print("⚠️ FAISS index is missing or corrupted. Rebuilding…")
+        rebuild_faiss_index()
+        index = _read_index_mmap(INDEX_PATH)
+    # nprobe / efSearch are not persisted by FAISS; restore the build-time choice
+    return apply_search_params(index, get_index_config().get("params", {}))
+
+
+def get_index_config() -> dict:
+    return _shared("index_config", load_index_config)
+
+
+def get_index() -> faiss.Index:
+    return _shared("index", _load_index)
+
+
+def get_metadata() -> MetadataStore:
+    return _shared("metadata", load_metadata_store)
+
+
+def get_manifest() -> dict:
+    return _shared("manifest", lambda: segments.load_manifest(len(get_metadata())))
+
+
+def get_live_mask():
+    """False for ids deleted or replaced by incremental updates; ``None`` if none are."""
+    def load():
+        dead = segments.load_tombstones()
+        if not len(dead):
+            return None
+        live = np.ones(len(get_metadata()), dtype=bool)
+        live[dead] = False
+        return live
+    return _shared("live_mask", load)
+
+
+def get_matrix() -> segments.SegmentedArray:
+    """Float32 embeddings, memory-mapped read-only (rows are paged in on demand)."""
+    return _shared("matrix", lambda: segments.SegmentedArray.open(get_manifest(), "matrix"))
+
+
+def _load_term_indicators():
+    try:
+        indicators = segments.SegmentedArray.open(get_manifest(), "indicators")
+        if indicators.shape == (len(get_metadata()), len(TERM_VOCAB)):
+            return indicators
+    except (OSError, ValueError):
+        pass
+    # Older vector stores: derive them once per process from the metadata
+    return build_term_indicators(get_metadata().to_pandas(["content"])["content"])
+
+
+def get_term_indicators() -> np.ndarray:
+    return _shared("term_indicators", _load_term_indicators)
+
+
+def _load_lexical_index() -> BM25Index:
+    try:
+        lexical = BM25Index.load(BM25_PATH)
+        if lexical.n_docs == len(get_metadata()):
+            return lexical
+    except (OSError, KeyError, ValueError):
+        pass
+    # Older vector stores: index the metadata once per process
+    return BM25Index.build(lexical_texts(get_metadata().to_pandas(["strain_name", "content"])))
+
+
+def get_lexical_index() -> BM25Index:
+    return _shared("lexical", _load_lexical_index)
+
+
+def _load_strain_centroids():
+    try:
+        ids = np.load(STRAIN_CENTROID_IDS_PATH)
+        centroids = np.load(STRAIN_CENTROIDS_PATH, mmap_mode="r")
+        if centroids.shape == (len(ids), get_matrix().shape[1]):
+            return ids, centroids
+    except (OSError, ValueError):
+        pass
+    # Older vector stores: average the chunk matrix once per process
+    live = get_live_mask()
+    return compute_strain_centroids(get_matrix(), get_metadata().column("strain_id"),
+                                    None if live is None else np.flatnonzero(live))
+
+
+def get_strain_centroids():
+    """``(strain ids, unit-norm centroids)`` for the coarse strain-level stage."""
+    return _shared("strain_centroids", _load_strain_centroids)
+
+
+def get_strain_chunks():
+    """CSR view of chunk ids per strain: ``(strain ids, ptr, chunk ids)``."""
+    def load():
+        owners = get_metadata().column("strain_id")
+        order = np.argsort(owners, kind="stable")
+        strains, starts = np.unique(owners[order], return_index=True)
+        return strains, np.r_[starts, len(order)].astype(np.int64), order.astype(np.int64)
+    return _shared("strain_chunks", load)
+
+
+# === Filters ===
+FILTERS = ("type", "dominant_terpene", "thc", "cbd")
+RANGE_FILTERS = ("thc", "cbd")
+# Filtered subsets up to this size are scored exactly from the memory-mapped
+# matrix; larger ones are searched in the index with an ID selector.
+BRUTE_FORCE_MAX = 4096
+
+
+def _lowered_column(name: str) -> np.ndarray:
+    def load():
+        column = get_metadata().table.column(name).cast("string").fill_null("")
+        return pc.utf8_lower(column).to_numpy(zero_copy_only=False)
+    return _shared(f"lowered:{name}", load)
+
+
+def filter_mask(filters: dict):
+    """Boolean mask over FAISS ids for structured filters, or ``None`` if unfiltered.
+
+    ``type`` / ``dominant_terpene`` take a string or list of strings (case
+    insensitive); ``thc`` / ``cbd`` take a ``(min, max)`` tuple, either end
+    ``None``. Filters on columns missing from an older vector store are skipped.
+    """
+    if not filters:
+        return None
+    store = get_metadata()
+    mask = np.ones(len(store), dtype=bool)
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter: {name} (expected one of {FILTERS})")
+        if name not in store.columns:
+            # Cached like any other resource, so it is printed once per loaded store
+            _shared(f"missing_filter:{name}", lambda: print(
+                f"⚠️ Vector store has no '{name}' column; rebuild it to filter on {name}."))
+            continue
+        if name in RANGE_FILTERS:
+            low, high = value
+            column = store.column(name)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        else:
+            values = [value] if isinstance(value, str) else list(value)
+            mask &= np.isin(_lowered_column(name), [v.lower() for v in values])
+    return mask
+
+
+# === Search ===
+AGGREGATIONS = ("max", "mean", "sum")
+
+
+def _search_ids(query_embedding, n: int, mask=None):
+    config = get_index_config()
+    params = config.get("params", {})
+    rerank_factor = params.get("rerank_factor")
+    metric = config.get("metric", "l2")
+    query_embedding = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+    if metric == "ip":
+        # Stored vectors were normalised at build time; only the query is left
+        query_embedding = normalize_rows(query_embedding)
+
+    live = get_live_mask()
+    if live is not None and (mask is not None or get_manifest().get("soft_deletes")):
+        # Removed ids are gone from the index itself unless it can't delete (HNSW)
+        mask = live if mask is None else mask & live
+    if mask is None:
+        matrix = get_matrix() if rerank_factor else None
+        return search_index(get_index(), query_embedding, n, matrix, rerank_factor)
+
+    ids = np.flatnonzero(mask)
+    if len(ids) == 0:
+        return np.array([], dtype="float32"), np.array([], dtype=np.int64)
+    if len(ids) <= BRUTE_FORCE_MAX and os.path.exists(MATRIX_PATH):
+        return rerank_exact(get_matrix(), query_embedding, ids, n, metric)
+
+    matrix = get_matrix() if rerank_factor else None
+    search_params = selector_params(mask, config.get("index_type", "flat"), params)
+    return search_index(get_index(), query_embedding, n, matrix, rerank_factor, search_params)
+
+
+def l2_to_similarity(distances: np.ndarray) -> np.ndarray:
+    """Squared L2 → cosine similarity (exact for unit-norm OpenAI embeddings)."""
+    return 1.0 - np.asarray(distances, dtype="float32") / 2.0
+
+
+def to_similarity(scores: np.ndarray) -> np.ndarray:
+    """Raw index scores → cosine similarity for the metric the store was built with."""
+    if get_index_config().get("metric", "l2") == "ip":
+        return np.asarray(scores, dtype="float32")
+    return l2_to_similarity(scores)
+
+
+def search_ids(query_embedding, k: int = 5, filters=None):
+    """``(scores, doc_ids)`` of the nearest live chunks, without the metadata join."""
+    refresh_if_updated()
+    return _search_ids(query_embedding, k, filter_mask(filters))
+
+
+def search(query_embedding, k: int = 5, filters=None) -> pd.DataFrame:
+    """Nearest-neighbour search returning metadata rows plus ``score`` and ``similarity``.
+
+    ``score`` is the raw index score: squared L2 distance (lower is better)
+    or, for an "ip" store, the inner product of unit vectors.
+    """
+    D, I = search_ids(query_embedding, k, filters)
+    results = get_metadata().take(I)
+    results["doc_id"] = I
+    results["score"] = D
+    results["similarity"] = to_similarity(D)
+    return results
+
+
+def collapse_by_strain(strain_ids: np.ndarray, scores: np.ndarray, k: int,
+                       agg: str = "max", top_m: int = 3):
+    """Group chunk hits by strain and rank strains by an aggregate of their scores.
+
+    ``scores`` are similarities (higher is better). ``agg`` is ``"max"``,
+    ``"mean"`` or ``"sum"`` (sum of the ``top_m`` best chunks per strain).
+    Returns ``(best_hit, strain_score, n_chunks)`` for the top ``k`` strains,
+    where ``best_hit`` indexes the strain's highest-scoring chunk in the input.
+    """
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation: {agg} (expected one of {AGGREGATIONS})")
+    if len(strain_ids) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, np.array([], dtype="float32"), empty
+
+    _, group = np.unique(strain_ids, return_inverse=True)
+    # Sort hits by strain, best chunk first within each strain
+    order = np.lexsort((-scores, group))
+    g_sorted, s_sorted = group[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, g_sorted[1:] != g_sorted[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+
+    if agg == "max":
+        strain_score = s_sorted[starts]
+    elif agg == "mean":
+        strain_score = np.add.reduceat(s_sorted, starts) / counts
+    else:
+        rank = np.arange(len(order)) - np.repeat(starts, counts)
+        strain_score = np.add.reduceat(np.where(rank < top_m, s_sorted, 0.0), starts)
+
+    top = np.argsort(-strain_score, kind="stable")[:k]
+    return order[starts[top]], strain_score[top].astype("float32"), counts[top]
+
+
+def search_strains(query_embedding, k: int = 5, overfetch: int = 10,
+                   agg: str = "max", top_m: int = 3, filters=None) -> pd.DataFrame:
+    """Return up to ``k`` distinct strains from ``k * overfetch`` chunk hits.
+
+    ``filters`` (see ``filter_mask``) are enforced inside the search, so a
+    filtered query still returns ``k`` strains when enough of them match.
+
+    Each row is the strain's best chunk, with its FAISS ``doc_id``, raw ``score``,
+    ``similarity``, the aggregated ``strain_score`` and ``n_chunks`` matched.
+    """
+    refresh_if_updated()
+    D, I = _search_ids(query_embedding, k * overfetch, filter_mask(filters))
+    metadata = get_metadata()
+    similarity = to_similarity(D)
+    strain_ids = metadata.column("strain_id")[I]
+    best, strain_score, n_chunks = collapse_by_strain(strain_ids, similarity, k, agg, top_m)
+
+    results = metadata.take(I[best])
+    results["doc_id"] = I[best]
+    results["score"] = D[best]
+    results["similarity"] = similarity[best]
+    results["strain_score"] = strain_score
+    results["n_chunks"] = n_chunks
+    return results
+
+
+def search_strains_two_stage(query_embedding, k: int = 5, candidates: int = 50,
+                             agg: str = "max", top_m: int = 3, filters=None) -> pd.DataFrame:
+    """Coarse-to-fine strain search: centroids pick strains, their chunks rank them.
+
+    Stage one scores the query against one centroid per strain and keeps the
+    ``candidates`` best; stage two scores every live chunk of those strains
+    exactly from the memory-mapped matrix and collapses them like
+    ``search_strains``. Cost depends on the strain count and chunks per
+    strain, not on the total number of chunks. Adds a ``centroid_score`` column.
+    """
+    refresh_if_updated()
+    metric = get_index_config().get("metric", "l2")
+    metadata = get_metadata()
+    strain_column = metadata.column("strain_id")
+    query = np.asarray(query_embedding, dtype="float32").reshape(1, -1)
+    unit_query = normalize_rows(query)
+
+    mask = filter_mask(filters)
+    live = get_live_mask()
+    if live is not None:
+        mask = live if mask is None else mask & live
+
+    centroid_ids, centroids = get_strain_centroids()
+    coarse = np.asarray(centroids @ unit_query[0], dtype="float32")
+    if mask is not None:
+        coarse[~np.isin(centroid_ids, strain_column[mask])] = -np.inf
+    n = min(max(candidates, k), int(np.isfinite(coarse).sum()))
+    top = np.argpartition(-coarse, n - 1)[:n] if n else np.array([], dtype=np.int64)
+
+    strains, ptr, chunk_ids = get_strain_chunks()
+    pos = np.searchsorted(strains, centroid_ids[top])
+    ids = np.concatenate([np.array([], dtype=np.int64)] + [chunk_ids[ptr[p]:ptr[p + 1]] for p in pos])
+    if mask is not None:
+        ids = ids[mask[ids]]
+    D, I = rerank_exact(get_matrix(), unit_query if metric == "ip" else query, ids, len(ids), metric)
+
+    similarity = to_similarity(D)
+    best, strain_score, n_chunks = collapse_by_strain(strain_column[I], similarity, k, agg, top_m)
+    doc_ids = I[best]
+    centroid_score = pd.Series(coarse[top], index=centroid_ids[top])
+
+    results = metadata.take(doc_ids)
+    results["doc_id"] = doc_ids
+    results["score"] = D[best]
+    results["similarity"] = similarity[best]
+    results["strain_score"] = strain_score
+    results["n_chunks"] = n_chunks
+    results["centroid_score"] = centroid_score.reindex(strain_column[doc_ids]).to_numpy(dtype="float32")
+    return results
+
+
+# === Hybrid (BM25 + vector) ===
+# The lexical top strain must be named in the query and beat the runner-up by
+# this factor (after the name boost) before the embedding call is skipped.
+DECISIVE_RATIO = 1.5
+
+
+def _lexical_is_decisive(query_text: str, strain_scores, names) -> bool:
+    if not len(strain_scores):
+        return False
+    if len(strain_scores) > 1 and strain_scores[0] < DECISIVE_RATIO * strain_scores[1]:
+        return False
+    name_tokens = set(tokenize(names[0]))
+    return bool(name_tokens) and name_tokens <= set(tokenize(query_text))
+
+
+def hybrid_search_strains(query_text: str, embed_fn, k: int = 5, overfetch: int = 10,
+                          agg: str = "max", top_m: int = 3, filters=None,
+                          rrf_k: int = 60) -> pd.DataFrame:
+    """BM25 + vector retrieval fused with reciprocal rank fusion, collapsed to strains.
+
+    ``embed_fn`` is called lazily: when the lexical ranking is decisive (the
+    query names one strain that clearly dominates) the embedding round trip
+    is skipped and ``results.attrs["embedding_skipped"]`` is True.
+    """
+    refresh_if_updated()
+    metadata = get_metadata()
+    strain_column = metadata.column("strain_id")
+    n = k * overfetch
+
+    mask = filter_mask(filters)
+    live = get_live_mask()
+    lexical_mask = live if mask is None else (mask if live is None else mask & live)
+    lex_scores, lex_ids = get_lexical_index().search(query_text, n, lexical_mask)
+
+    # Chunks of a strain the query names outright rank above incidental mentions
+    query_tokens = set(tokenize(query_text))
+    names = metadata.take(lex_ids, ["strain_name"])["strain_name"].tolist()
+    name_tokens = [frozenset(tokenize(name)) for name in names]
+    matched = {t for t in name_tokens if t and t <= query_tokens}
+    # "Super Blue Dream" in the query names that strain, not "Blue Dream"
+    matched = {t for t in matched if not any(t < other for other in matched)}
+    named = np.array([t in matched for t in name_tokens], dtype=bool)
+    if named.any():
+        lex_scores = lex_scores + named * lex_scores.max()
+        order = np.argsort(-lex_scores, kind="stable")
+        lex_scores, lex_ids, names = lex_scores[order], lex_ids[order], [names[i] for i in order]
+
+    best, lex_strain_scores, _ = collapse_by_strain(strain_column[lex_ids], lex_scores, 2, "max")
+    skipped = _lexical_is_decisive(query_text, lex_strain_scores, [names[i] for i in best])
+
+    D = np.array([], dtype="float32")
+    I = np.array([], dtype=np.int64)
+    if not skipped:
+        query_embedding = embed_fn()
+        if query_embedding is not None:
+            D, I = _search_ids(query_embedding, n, mask)
+
+    fused_ids, fused = reciprocal_rank_fusion([I, lex_ids], rrf_k)
+    best, strain_score, n_chunks = collapse_by_strain(strain_column[fused_ids], fused, k, agg, top_m)
+    doc_ids = fused_ids[best]
+
+    distance = pd.Series(D, index=I).groupby(level=0).first()
+    lexical = pd.Series(lex_scores, index=lex_ids)
+    results = metadata.take(doc_ids)
+    results["doc_id"] = doc_ids
+    results["score"] = distance.reindex(doc_ids).to_numpy(dtype="float32")
+    results["similarity"] = to_similarity(results["score"].to_numpy())
+    results["lexical_score"] = lexical.reindex(doc_ids).fillna(0.0).to_numpy(dtype="float32")
+    results["strain_score"] = strain_score
+    results["n_chunks"] = n_chunks
+    results.attrs["embedding_skipped"] = skipped
+    return results
@@ -0,0 +1,116 @@
+# === utils/scrape_cache.py ===
+"""
+Persistent cache of scraped strain pages shared by every page and worker.
+
+Each source page's parsed result is stored as JSON in a local SQLite
+database keyed by its URL, together with the outcome of the request:
+``ok``, ``empty`` (nothing could be parsed, e.g. a network error the scraper
+swallowed), ``not_found`` (HTTP 404) or ``timeout``. ``lookup`` classifies an
+entry by its age against per-source / per-outcome TTLs:
+
+* ``fresh``  — serve it, no request;
+* ``stale``  — an ``ok`` page past its TTL but younger than ``STALE_MAX_AGE``;
+  serve it and refresh in the background;
+* ``None``   — missing or expired; scrape it now.
+
+Negative outcomes are fresh for a short while so a dead URL or a slow source
+is not retried on every Streamlit rerun.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_PATH = os.getenv("SCRAPE_CACHE_PATH", os.path.join(ROOT, "data", "cache", "scrapes.sqlite"))
+
+HOUR, DAY = 3600, 86400
+# Seconds an ``ok`` page is served without refreshing, per source
+SOURCE_TTLS = {"leafly": 7 * DAY, "allbud": 14 * DAY, "weedmaps": 2 * DAY}
+DEFAULT_TTL = DAY
+STALE_MAX_AGE = 60 * DAY  # older ``ok`` pages are scraped again before rendering
+# Seconds a negative outcome is trusted before the URL is tried again
+NEGATIVE_TTLS = {"not_found": 7 * DAY, "timeout": 15 * 60, "empty": HOUR}
+STATUSES = ("ok",) + tuple(NEGATIVE_TTLS)
+
+
+def classify(source: str, status: str, age: float):
+    """``"fresh"``, ``"stale"`` or None (expired) for an entry of this age."""
+    if status == "ok":
+        if age < SOURCE_TTLS.get(source, DEFAULT_TTL):
+            return "fresh"
+        return "stale" if age < STALE_MAX_AGE else None
+    return "fresh" if age < NEGATIVE_TTLS.get(status, 0) else None
+
+
+class ScrapeCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY, source TEXT NOT NULL, status TEXT NOT NULL,"
+                " data TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # SQLite connections are not shareable across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, urls) -> dict:
+        """``{url: (state, data)}`` for cached ``urls`` that are fresh or stale (see module docstring)."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        now = time.time()
+        rows = self._conn().execute(
+            f"SELECT url, source, status, data, fetched_at FROM pages WHERE url IN ({','.join('?' * len(urls))})",
+            urls,
+        ).fetchall()
+        found = {}
+        for url, source, status, data, fetched_at in rows:
+            state = classify(source, status, now - fetched_at)
+            if state is not None:
+                found[url] = (state, json.loads(data))
+        return found
+
+    def put(self, url: str, source: str, status: str, data: dict = None, started: float = None):
+        """Record the outcome of scraping ``url``.
+
+        With ``started`` (a ``time.time()``), the write is skipped if the entry
+        was updated after that moment, so a late timeout mark never overwrites
+        the result of the request that did finish.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"unknown scrape status: {status}")
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO pages (url, source, status, data, fetched_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(url) DO UPDATE SET source = excluded.source, status = excluded.status,"
+                " data = excluded.data, fetched_at = excluded.fetched_at"
+                " WHERE ? IS NULL OR pages.fetched_at < ?",
+                (url, source, status, json.dumps(data or {}), time.time(), started, started),
+            )
+
+
+_CACHE = []
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> ScrapeCache:
+    """Process-wide cache instance (the database itself is shared across processes)."""
+    with _CACHE_LOCK:
+        if not _CACHE:
+            _CACHE.append(ScrapeCache())
+        return _CACHE[0]
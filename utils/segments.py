@@ -0,0 +1,111 @@
+# === utils/segments.py ===
+"""
+Append-only segments of the vector store.
+
+A full build writes one base segment (docs_metadata.arrow,
+embeddings_matrix.npy, term_indicators.npy). Incremental updates append
+further segments and record replaced/deleted FAISS ids as tombstones until
+the next compaction. FAISS ids are global row numbers across segments, so
+segment ``s`` covers ids ``[start, start + rows)``.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from utils.metadata_store import MetadataStore
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+VECTOR_STORE_DIR = os.path.join(ROOT, "vector_store")
+MANIFEST_PATH = os.path.join(VECTOR_STORE_DIR, "segments.json")
+TOMBSTONES_PATH = os.path.join(VECTOR_STORE_DIR, "deleted_ids.npy")
+
+BASE_SEGMENT = {
+    "metadata": "docs_metadata.arrow",
+    "matrix": "embeddings_matrix.npy",
+    "indicators": "term_indicators.npy",
+}
+
+
+# How chunk keys are derived (see faiss_utils.chunk_keys); stores without it key by row position
+KEY_SCHEME = "strain-name"
+
+
+def base_manifest(rows: int) -> dict:
+    return {"segments": [dict(BASE_SEGMENT, start=0, rows=int(rows))],
+            "next_id": int(rows), "soft_deletes": False, "key_scheme": KEY_SCHEME}
+
+
+def segment_files(n: int) -> dict:
+    return {key: name.replace(".", f".seg{n:03d}.", 1) for key, name in BASE_SEGMENT.items()}
+
+
+def load_manifest(default_rows: int = 0) -> dict:
+    """Read segments.json; stores built before segments are a single base segment."""
+    if not os.path.exists(MANIFEST_PATH):
+        return base_manifest(default_rows)
+    with open(MANIFEST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, MANIFEST_PATH)  # readers never see a half-written manifest
+
+
+def segment_path(name: str) -> str:
+    return os.path.join(VECTOR_STORE_DIR, name)
+
+
+def load_tombstones() -> np.ndarray:
+    if not os.path.exists(TOMBSTONES_PATH):
+        return np.array([], dtype=np.int64)
+    return np.load(TOMBSTONES_PATH)
+
+
+def save_tombstones(ids: np.ndarray):
+    np.save(TOMBSTONES_PATH, np.unique(np.asarray(ids, dtype=np.int64)))
+
+
+def clear_tombstones():
+    if os.path.exists(TOMBSTONES_PATH):
+        os.remove(TOMBSTONES_PATH)
+
+
+class SegmentedArray:
+    """Row-indexable view over per-segment ``.npy`` files (memory-mapped)."""
+
+    def __init__(self, parts, starts):
+        self.parts = parts
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.shape = (int(sum(len(p) for p in parts)),) + parts[0].shape[1:]
+        self.dtype = parts[0].dtype
+
+    @classmethod
+    def open(cls, manifest: dict, key: str) -> "SegmentedArray":
+        segments = manifest["segments"]
+        parts = [np.load(segment_path(s[key]), mmap_mode="r") for s in segments]
+        return cls(parts, [s["start"] for s in segments])
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, ids):
+        if len(self.parts) == 1:
+            return self.parts[0][ids]
+        ids = np.asarray(ids, dtype=np.int64)
+        which = np.searchsorted(self.starts, ids, side="right") - 1
+        out = np.empty((len(ids),) + self.shape[1:], dtype=self.dtype)
+        for s in np.unique(which):
+            sel = which == s
+            out[sel] = self.parts[s][ids[sel] - self.starts[s]]
+        return out
+
+
+def open_metadata(manifest: dict) -> MetadataStore:
+    stores = [MetadataStore.open(segment_path(s["metadata"])) for s in manifest["segments"]]
+    return MetadataStore.concat(stores) if len(stores) > 1 else stores[0]
@@ -0,0 +1,181 @@
+# === utils/terpene_inference.py ===
+"""
+Runtime dominant-terpene inference with the imputer trained by
+scripts/clean_strain_data.py.
+
+The model, label encoder and feature list (terpene_model_meta.json) are
+loaded once per process and reloaded when the model file changes.
+``TerpenePredictor.predict`` takes a batch of effect/THC/CBD feature rows
+and returns the predicted terpene and its probability. Predictions are
+cached by a hash of the feature row, so a page of cards costs at most one
+vectorised ``predict_proba`` call, and none once it has been seen.
+
+``infer_missing_terpenes`` fills in strains whose catalogue terpene is
+unknown, taking features from the cleaned catalogue by strain name and
+falling back to whatever THC/CBD/effect columns the row itself carries.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODEL_DIR = os.path.join(ROOT, "data", "models")
+MODEL_PATH = os.path.join(MODEL_DIR, "xgb_terpene_predictor.pkl")
+ENCODER_PATH = os.path.join(MODEL_DIR, "terpene_label_encoder.pkl")
+MODEL_META_PATH = os.path.join(MODEL_DIR, "terpene_model_meta.json")
+CATALOGUE_PATH = os.path.join(ROOT, "data", "cleaned_strains.parquet")
+
+UNKNOWN_TERPENES = {"", "unknown", "nan", "none", "n/a"}
+CACHE_SIZE = 10_000
+
+class TerpenePredictor:
+    """Batched terpene prediction with a per-feature-row LRU cache."""
+
+    def __init__(self, model, encoder, features: list, cache_size: int = CACHE_SIZE):
+        self.model = model
+        self.encoder = encoder
+        self.features = list(features)
+        self.cache_size = cache_size
+        # Placeholder labels (e.g. "nan") can be classes of the imputer but are never a prediction
+        classes = pd.Series(np.asarray(encoder.classes_).astype(str))
+        self._known = np.flatnonzero(~is_unknown_terpene(classes))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, model_path: str = MODEL_PATH, encoder_path: str = ENCODER_PATH,
+             meta_path: str = MODEL_META_PATH) -> "TerpenePredictor":
+        model = joblib.load(model_path)
+        encoder = joblib.load(encoder_path)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                features = json.load(f)["features"]
+        else:
+            # Models saved before the meta file: sklearn records the training columns
+            features = list(model.feature_names_in_)
+        return cls(model, encoder, features)
+
+    def feature_matrix(self, rows: pd.DataFrame) -> np.ndarray:
+        """(n, n_features) float32 in training column order; missing/non-numeric values are 0."""
+        X = rows.reindex(columns=self.features)
+        text = [c for c, dtype in X.dtypes.items() if not pd.api.types.is_numeric_dtype(dtype)]
+        if text:
+            X[text] = X[text].apply(pd.to_numeric, errors="coerce")
+        return np.ascontiguousarray(np.nan_to_num(X.to_numpy(dtype=np.float32), nan=0.0))
+
+    def predict(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """``dominant_terpene`` and ``probability`` for each row of ``rows`` (same index).
+
+        Only real terpenes are predicted, with probabilities renormalised over
+        them; a row the model gives no real terpene any weight gets None / NaN.
+        """
+        X = self.feature_matrix(rows)
+        # Each row's raw bytes is its cache key
+        keys = X.view(np.dtype((np.void, X.shape[1] * X.itemsize))).ravel().tolist() if len(X) else []
+        labels = np.empty(len(X), dtype=object)
+        probs = np.zeros(len(X), dtype=np.float64)
+        with self._lock:
+            todo = []
+            for i, key in enumerate(keys):
+                hit = self._cache.get(key)
+                if hit is None:
+                    todo.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    labels[i], probs[i] = hit
+
+        if todo:
+            # Identical feature rows in one batch are predicted once
+            unique, first, inverse = np.unique(X[todo], axis=0, return_index=True, return_inverse=True)
+            proba = self.model.predict_proba(pd.DataFrame(unique, columns=self.features))[:, self._known]
+            names = np.full(len(unique), None, dtype=object)
+            top = np.full(len(unique), np.nan)
+            mass = proba.sum(axis=1)
+            ok = mass > 0
+            if ok.any():
+                best = proba[ok].argmax(axis=1)
+                names[ok] = self.encoder.inverse_transform(self._known[best])
+                top[ok] = proba[ok][np.arange(len(best)), best] / mass[ok]
+            inverse = inverse.ravel()
+            labels[todo] = names[inverse]
+            probs[todo] = top[inverse]
+            with self._lock:
+                for j in first:
+                    i = todo[j]
+                    self._cache[keys[i]] = (labels[i], float(probs[i]))
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return pd.DataFrame({"dominant_terpene": labels, "probability": probs}, index=rows.index)
+
+# === Process-wide instance ===
+_LOCK = threading.Lock()
+_STATE = {"predictor": None, "mtime": None, "catalogue": None}
+
+def get_predictor():
+    """Shared predictor, or None when no trained model is available."""
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return None
+    with _LOCK:
+        if _STATE["mtime"] != mtime:
+            try:
+                _STATE["predictor"] = TerpenePredictor.load()
+            except (OSError, KeyError, ValueError, AttributeError) as e:
+                print(f"⚠️ Terpene model unavailable: {e}")
+                _STATE["predictor"] = None
+            _STATE["mtime"] = mtime
+            _STATE["catalogue"] = None
+        return _STATE["predictor"]
+
+def _catalogue_features(features: list) -> pd.DataFrame:
+    """Feature rows of the cleaned catalogue indexed by lower-cased strain name."""
+    with _LOCK:
+        if _STATE["catalogue"] is None:
+            frame = pd.DataFrame(columns=features)
+            if os.path.exists(CATALOGUE_PATH):
+                available = set(pq.read_schema(CATALOGUE_PATH).names)
+                columns = [c for c in features if c in available]
+                if "strain_name" in available:
+                    frame = pd.read_parquet(CATALOGUE_PATH, columns=["strain_name"] + columns)
+                    frame.index = frame.pop("strain_name").astype(str).str.lower()
+                    frame = frame[~frame.index.duplicated()]
+            _STATE["catalogue"] = frame
+        return _STATE["catalogue"]
+
+def is_unknown_terpene(values: pd.Series) -> np.ndarray:
+    return values.isna().to_numpy() | values.astype(str).str.strip().str.lower().isin(UNKNOWN_TERPENES).to_numpy()
+
+def infer_missing_terpenes(rows: pd.DataFrame) -> pd.DataFrame:
+    """Predictions (``dominant_terpene``, ``probability``) for rows whose terpene is unknown.
+
+    Indexed like the subset of ``rows`` it covers; empty when every terpene
+    is known or no model is available.
+    """
+    empty = pd.DataFrame({"dominant_terpene": pd.Series(dtype=object), "probability": pd.Series(dtype=float)})
+    terpenes = rows["dominant_terpene"] if "dominant_terpene" in rows else pd.Series(np.nan, index=rows.index)
+    missing = rows[is_unknown_terpene(terpenes)]
+    predictor = get_predictor() if len(missing) else None
+    if predictor is None:
+        return empty
+
+    names = missing["strain_name"].astype(str).str.lower() if "strain_name" in missing else pd.Series("", index=missing.index)
+    features = _catalogue_features(predictor.features).reindex(columns=predictor.features).reindex(names.to_numpy())
+    features.index = missing.index
+    for col in predictor.features:
+        if col in missing:
+            features[col] = features[col].fillna(pd.to_numeric(missing[col], errors="coerce"))
+    # A row with no features at all would just get the majority class
+    features = features[features.notna().any(axis=1)]
+    if not len(features):
+        return empty
+    predicted = predictor.predict(features)
+    return predicted[predicted["dominant_terpene"].notna()]
@@ -0,0 +1,208 @@
+# === utils/text_cleaning.py ===
+"""
+Strain name / description cleaning used by scripts/clean_strain_data.py.
+
+``fix_strain_name`` and ``clean_description`` clean one value; the column
+versions (``clean_names``, ``clean_descriptions``) give the same result per
+row but only run ``html.unescape`` + BeautifulSoup on rows that contain
+``<`` or ``&`` (spread over a process pool when there are many). They also
+only NFKC-normalise / apply the mojibake table on non-ASCII rows, and do
+everything else with vectorised pandas string operations.
+
+``clean_text_cached`` keeps the cleaned text of every row in a SQLite
+``TextCache`` keyed by a fingerprint of its raw name + description, so a
+refresh only cleans rows that are new or changed.
+"""
+
+import os
+import re
+import html
+import sqlite3
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEXT_CACHE_PATH = os.path.join(ROOT, "data", "cache", "cleaned_text.sqlite")
+CLEANING_VERSION = "1"  # bump whenever the rules below change; invalidates cached rows
+
+BAD_REPLACEMENTS = {
+    "â€™": "'", "â€’": "-", "â€“": "-", "â€”": "-", "Ã©": "e",
+    "Ã": "A",  "�": "",  "“": '"', "”": '"'
+}
+
+INVISIBLE_SPACE_RE = re.compile(r"[\u00A0\u200B\u200C\u200D\u202F\u2060]+")
+MARKUP_PATTERN = r"[<&]"        # rows html.unescape / BeautifulSoup can change
+NON_ASCII_PATTERN = r"[^\x00-\x7F]"
+PARALLEL_MIN_ROWS = 2000        # fewer markup rows than this are parsed in-process
+MARKUP_BATCH = 256
+
+# === Row helpers ===
+def fix_strain_name(text: str) -> str:
+    if not isinstance(text, str):
+        return "unknown"
+    text = html.unescape(text)
+    text = BeautifulSoup(text, "html.parser").get_text()
+    text = unicodedata.normalize("NFKC", text)
+    for bad, good in BAD_REPLACEMENTS.items():
+        text = text.replace(bad, good)
+    return re.sub(r"\s+", " ", text).strip()
+
+def clean_description(text: str) -> str:
+    """Remove HTML, invisible bytes/spaces, keep punctuation & case."""
+    if not isinstance(text, str):
+        return ""
+    text = html.unescape(text)
+    text = BeautifulSoup(text, "html.parser").get_text(separator=" ")
+    text = unicodedata.normalize("NFKC", text)
+
+    # remove stray high-bit bytes while keeping ASCII punctuations
+    text = text.encode("ascii", "ignore").decode("ascii")
+    text = INVISIBLE_SPACE_RE.sub(" ", text)          # kill nbsp / zero-width
+    return re.sub(r"\s+", " ", text).strip()
+
+# === Column engine ===
+def _strip_markup_batch(args):
+    texts, separator = args
+    return [BeautifulSoup(html.unescape(t), "html.parser").get_text(separator) for t in texts]
+
+def strip_markup(texts: pd.Series, separator: str = "", workers: int = None) -> pd.Series:
+    """``html.unescape`` + BeautifulSoup text for rows with markup; other rows pass through."""
+    mask = texts.str.contains(MARKUP_PATTERN, regex=True).to_numpy(dtype=bool)
+    if not mask.any():
+        return texts
+    rows = texts[mask].tolist()
+    batches = [(rows[lo:lo + MARKUP_BATCH], separator) for lo in range(0, len(rows), MARKUP_BATCH)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(rows) < PARALLEL_MIN_ROWS:
+        parsed = [_strip_markup_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_strip_markup_batch, batches))
+    texts = texts.copy()
+    texts[mask] = [t for batch in parsed for t in batch]
+    return texts
+
+def _non_ascii(texts: pd.Series):
+    return texts.str.contains(NON_ASCII_PATTERN, regex=True).to_numpy(dtype=bool)
+
+def _collapse_whitespace(texts: pd.Series) -> pd.Series:
+    # split() and re's \s agree on what whitespace is; same as re.sub(r"\s+", " ", t).strip()
+    return texts.str.split().str.join(" ")
+
+def _strings(values: pd.Series, default: str):
+    """``(texts, is_text)``: string rows as an object Series, others set to ``default``."""
+    is_text = values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    texts = values.astype(object).where(is_text, default)
+    return texts, is_text
+
+def clean_names(names: pd.Series, workers: int = None) -> pd.Series:
+    """``fix_strain_name`` over a column."""
+    texts, is_text = _strings(names, "")
+    texts = strip_markup(texts, "", workers)
+    wide = _non_ascii(texts)  # NFKC and every mojibake key only touch non-ASCII text
+    if wide.any():
+        fixed = texts[wide].str.normalize("NFKC")
+        for bad, good in BAD_REPLACEMENTS.items():
+            fixed = fixed.str.replace(bad, good, regex=False)
+        texts[wide] = fixed
+    return _collapse_whitespace(texts).where(is_text, "unknown").astype(object)
+
+def clean_descriptions(descriptions: pd.Series, workers: int = None) -> pd.Series:
+    """``clean_description`` over a column."""
+    texts, is_text = _strings(descriptions, "")
+    texts = strip_markup(texts, " ", workers)
+    wide = _non_ascii(texts)
+    if wide.any():
+        # NFKC can map some characters to ASCII before the high-bit strip; the
+        # invisible spaces are all non-ASCII, so the strip removes them as well
+        texts[wide] = (texts[wide].str.normalize("NFKC")
+                                  .str.replace(NON_ASCII_PATTERN, "", regex=True))
+    return _collapse_whitespace(texts).where(is_text, "").astype(object)
+
+# === Row cache ===
+def row_fingerprints(*columns: pd.Series) -> np.ndarray:
+    """64-bit content hash per row over ``columns`` (non-string values hash alike)."""
+    frame = pd.DataFrame({str(i): pd.Series(col).astype(object).reset_index(drop=True)
+                          for i, col in enumerate(columns)})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+class TextCache:
+    """Cleaned ``(strain_name, description)`` per raw-row fingerprint, in SQLite.
+
+    Looked up and filled one batch at a time, so memory does not grow with
+    the catalogue. Fingerprints seen through ``lookup`` are remembered (8
+    bytes each); ``prune`` then drops rows that are no longer in the source.
+    """
+
+    def __init__(self, path: str = TEXT_CACHE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rows ("
+                          " fingerprint INTEGER PRIMARY KEY, strain_name TEXT, description TEXT)")
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'cleaning_version'").fetchone()
+        if version is None or version[0] != CLEANING_VERSION:
+            self.clear()
+        self._seen = []
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM rows")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('cleaning_version', ?)", (CLEANING_VERSION,))
+
+    def lookup(self, fingerprints: np.ndarray) -> pd.DataFrame:
+        """Cached rows for ``fingerprints`` (indexed by fingerprint; misses are absent)."""
+        keys = np.asarray(fingerprints, dtype=np.uint64).view(np.int64)
+        self._seen.append(keys)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (fingerprint INTEGER PRIMARY KEY)")
+        with self.conn:
+            self.conn.execute("DELETE FROM wanted")
+            self.conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((int(k),) for k in keys))
+        found = self.conn.execute("SELECT r.fingerprint, r.strain_name, r.description FROM rows r"
+                                  " JOIN wanted USING (fingerprint)").fetchall()
+        frame = pd.DataFrame(found, columns=["fingerprint", "strain_name", "description"], dtype=object)
+        frame.index = pd.Index(frame.pop("fingerprint").to_numpy(dtype=np.int64).view(np.uint64))
+        return frame
+
+    def store(self, fingerprints: np.ndarray, names, descriptions):
+        keys = np.asarray(fingerprints, dtype=np.uint64).view(np.int64)
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?)",
+                                  zip(map(int, keys), names, descriptions))
+
+    def prune(self) -> int:
+        """Delete rows whose fingerprint was not looked up this run; returns how many."""
+        seen = np.unique(np.concatenate(self._seen)) if self._seen else np.empty(0, dtype=np.int64)
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (fingerprint INTEGER PRIMARY KEY)")
+        with self.conn:
+            self.conn.execute("DELETE FROM keep")
+            self.conn.executemany("INSERT INTO keep VALUES (?)", ((int(k),) for k in seen))
+            return self.conn.execute("DELETE FROM rows WHERE fingerprint NOT IN (SELECT fingerprint FROM keep)").rowcount
+
+    def close(self):
+        self.conn.close()
+
+def clean_text_cached(names: pd.Series, descriptions: pd.Series, cache: TextCache = None,
+                      workers: int = None):
+    """``(names, descriptions, n_cleaned)`` cleaned; only rows missing from ``cache`` are cleaned."""
+    if cache is None:
+        return clean_names(names, workers), clean_descriptions(descriptions, workers), len(names)
+    fingerprints = row_fingerprints(names, descriptions)
+    cached = cache.lookup(fingerprints)
+    pos = cached.index.get_indexer(fingerprints)
+    hit, miss = pos >= 0, pos < 0
+    out_names = np.empty(len(pos), dtype=object)
+    out_descriptions = np.empty(len(pos), dtype=object)
+    out_names[hit] = cached["strain_name"].to_numpy()[pos[hit]]
+    out_descriptions[hit] = cached["description"].to_numpy()[pos[hit]]
+    if miss.any():
+        out_names[miss] = clean_names(names.iloc[miss], workers).to_numpy()
+        out_descriptions[miss] = clean_descriptions(descriptions.iloc[miss], workers).to_numpy()
+        cache.store(fingerprints[miss], out_names[miss], out_descriptions[miss])
+    return (pd.Series(out_names, index=names.index), pd.Series(out_descriptions, index=descriptions.index),
+            int(miss.sum()))